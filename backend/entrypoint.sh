@@ -1,5 +1,16 @@
 #!/bin/sh
-python manage.py collectstatic --noinput
-python manage.py makemigrations
-python manage.py migrate
-gunicorn foodgram.wsgi:application --bind 0.0.0.0:8000 --timeout 90
+# Миграции и статика выполняются один раз в release.sh. depends_on
+# в docker-compose не ждет его завершения, поэтому backend ждет, пока
+# не останется непримененных миграций.
+attempt=0
+until python manage.py migrate --check > /dev/null 2>&1; do
+    attempt=$((attempt + 1))
+    if [ "$attempt" -ge 60 ]; then
+        echo "Миграции не применены, запустите release" >&2
+        exit 1
+    fi
+    sleep 3
+done
+# GUNICORN_APP=foodgram.asgi:application вместе с воркером uvicorn
+# запускает приложение через ASGI.
+exec gunicorn "${GUNICORN_APP:-foodgram.wsgi:application}" -c gunicorn.conf.py
@@ -0,0 +1,47 @@
+"""Проверка постоянных соединений с базой перед повторным использованием.
+
+Параметр CONN_HEALTH_CHECKS в DATABASES появился в Django 4.1. На 3.2
+соединение, которое переживает запросы благодаря CONN_MAX_AGE,
+проверяется здесь, но не в каждом запросе: SELECT 1 выполняется, только
+если соединение простояло без дела DB_HEALTH_CHECK_IDLE секунд и база
+могла его закрыть (перезапуск, pgbouncer, таймаут). Соединение, на
+котором произошла ошибка, Django сам проверяет и закрывает в конце
+запроса.
+"""
+import time
+
+import django
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        idle_since = getattr(connection, 'idle_since', None)
+        if (
+            connection.connection is not None
+            and connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and idle_since is not None
+            and now - idle_since >= settings.DB_HEALTH_CHECK_IDLE
+            and not connection.is_usable()
+        ):
+            connection.close()
+
+
+def mark_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+def connect_health_checks():
+    if django.VERSION < (4, 1):
+        request_started.connect(
+            check_connections, dispatch_uid='foodgram_check_connections'
+        )
+        request_finished.connect(
+            mark_idle, dispatch_uid='foodgram_mark_idle'
+        )
@@ -0,0 +1,169 @@
+"""Профилирование запросов: SQL, время представления и отрисовки.
+
+Middleware включается настройкой PROFILING и профилирует долю
+PROFILING_SAMPLE_RATE запросов, остальные проходят без обертки.
+Для выбранного запроса считаются число и время SQL-запросов и самые
+частые повторы (отпечаток запроса без литералов, так видны N+1),
+время представления вместе с сериализацией и время отрисовки ответа.
+Итог уходит в заголовок Server-Timing и строкой JSON в журнал
+foodgram.profiling. Если задан PROFILING_CPROFILE_DIR, медленные
+запросы (от PROFILING_SLOW_MS) сохраняют туда вывод cProfile.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+# Длина отпечатка в журнале.
+FINGERPRINT_LENGTH = 300
+
+
+def fingerprint(sql):
+    """SQL без литералов и с одним элементом в списках IN."""
+    return IN_LISTS.sub('(...)', LITERALS.sub('?', sql))
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.view_started = None
+        self.view_time = None
+        self.render_time = None
+        self.total_time = None
+
+    def record_query(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return [
+            {'sql': sql[:FINGERPRINT_LENGTH], 'count': count}
+            for sql, count in self.fingerprints.most_common(
+                settings.PROFILING_TOP_N
+            )
+            if count > 1
+        ]
+
+    def timings(self):
+        """Метрика -> время в мс; app — представление без SQL."""
+        timings = {'total': ms(self.total_time), 'db': ms(self.db_time)}
+        if self.view_time is not None:
+            timings['view'] = ms(self.view_time)
+            timings['app'] = ms(max(self.view_time - self.db_time, 0))
+        if self.render_time is not None:
+            timings['render'] = ms(self.render_time)
+        return timings
+
+    def server_timing(self):
+        timings = self.timings()
+        metrics = [
+            f'{name};dur={duration}' for name, duration in timings.items()
+            if name != 'db'
+        ]
+        duplicated = sum(item['count'] - 1 for item in self.duplicates())
+        metrics.append(
+            f'db;dur={timings["db"]};'
+            f'desc="{self.queries} queries, {duplicated} duplicated"'
+        )
+        return ', '.join(metrics)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = request.profile = RequestProfile()
+        profiler = (
+            cProfile.Profile() if settings.PROFILING_CPROFILE_DIR else None
+        )
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(profile.record_query)
+                )
+            if profiler is not None:
+                stack.callback(profiler.disable)
+                profiler.enable()
+            response = self.get_response(request)
+        profile.total_time = time.perf_counter() - profile.started
+        self.report(request, response, profile, profiler)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается последним перед отрисовкой ответа DRF.
+        profile = getattr(request, 'profile', None)
+        if profile is None or profile.view_started is None:
+            return response
+        started = time.perf_counter()
+        profile.view_time = started - profile.view_started
+
+        def rendered(response):
+            profile.render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, profile, profiler):
+        response['Server-Timing'] = profile.server_timing()
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': profile.queries,
+        }
+        for name, duration in profile.timings().items():
+            record[f'{name}_ms'] = duration
+        record['duplicates'] = profile.duplicates()
+        slow = record['total_ms'] >= settings.PROFILING_SLOW_MS
+        if slow and profiler is not None:
+            record['cprofile'] = self.dump(request, profiler)
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            json.dumps(record, ensure_ascii=False)
+        )
+
+    def dump(self, request, profiler):
+        """Сохранить вывод cProfile, вернуть путь к файлу."""
+        os.makedirs(settings.PROFILING_CPROFILE_DIR, exist_ok=True)
+        name = re.sub(r'\W+', '_', request.path).strip('_')[:80]
+        path = os.path.join(
+            settings.PROFILING_CPROFILE_DIR,
+            f'{int(time.time() * 1000)}-{request.method}-{name}.prof'
+        )
+        profiler.dump_stats(path)
+        return path
@@ -1,16 +1,29 @@
 import os
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-SECRET_KEY = os.getenv('SECRET_KEY', default="123456789"),
+# Профиль настроек: dev — локальная разработка, test — прогон тестов,
+# prod — работа за gunicorn и nginx.
+PROFILES = ('dev', 'test', 'prod')
+PROFILE = os.getenv('DJANGO_PROFILE', default='dev')
+if PROFILE not in PROFILES:
+    raise ImproperlyConfigured(
+        f'DJANGO_PROFILE должен быть одним из {PROFILES}, а не {PROFILE}.'
+    )
 
-DEBUG = True
+SECRET_KEY = os.getenv('SECRET_KEY', default='123456789')
+if PROFILE == 'prod' and 'SECRET_KEY' not in os.environ:
+    raise ImproperlyConfigured('В профиле prod нужен SECRET_KEY.')
 
-ALLOWED_HOSTS = ['*']
+# При DEBUG Django хранит в памяти каждый SQL-запрос.
+DEBUG = os.getenv('DEBUG', default=str(PROFILE == 'dev')) == 'True'
+
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', default='*').split(',')
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -19,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -47,6 +61,34 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Профилирование запросов (foodgram.profiling): доля профилируемых
+# запросов, порог медленного запроса в мс, сколько повторяющихся
+# SQL-запросов показывать и каталог для вывода cProfile.
+PROFILING = os.getenv('PROFILING', default='False') == 'True'
+PROFILING_SAMPLE_RATE = float(
+    os.getenv('PROFILING_SAMPLE_RATE', default=0.01)
+)
+PROFILING_SLOW_MS = int(os.getenv('PROFILING_SLOW_MS', default=500))
+PROFILING_TOP_N = int(os.getenv('PROFILING_TOP_N', default=5))
+PROFILING_CPROFILE_DIR = os.getenv('PROFILING_CPROFILE_DIR') or None
+if PROFILING:
+    MIDDLEWARE.insert(0, 'foodgram.profiling.ProfilingMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -66,7 +108,22 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Шаблоны (админка, browsable API) разбираются один раз на процесс.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Асинхронные версии списка тегов, автодополнения ингредиентов и рецепта
+# (recipes.async_views). Имеют смысл при запуске через ASGI (uvicorn).
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', default='False') == 'True'
 
 DATABASES = {
     'default': {
@@ -76,9 +133,78 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default="postgres"),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default="postgres"),
         'HOST': os.getenv('DB_HOST', default="localhost"),
-        'PORT': os.getenv('DB_PORT', default="5432")
+        'PORT': os.getenv('DB_PORT', default="5432"),
+        # В prod соединение живет между запросами и проверяется перед
+        # повторным использованием после простоя (см. foodgram.db).
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE', default=60 if PROFILE == 'prod' else 0
+        )),
+        'CONN_HEALTH_CHECKS': PROFILE == 'prod',
+    }
+}
+
+# Сколько секунд соединение может простаивать без проверки SELECT 1.
+DB_HEALTH_CHECK_IDLE = int(os.getenv('DB_HEALTH_CHECK_IDLE', default=30))
+
+# DB_POOLER=pgbouncer: соединения идут через pgbouncer в режиме
+# transaction, где серверные курсоры .iterator() не переживают
+# транзакцию.
+if os.getenv('DB_POOLER') == 'pgbouncer':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Версии ресурсов для ETag, отметки пользователей и готовые ответы
+# хранятся в кэше. Воркеры gunicorn — отдельные процессы, поэтому в prod
+# нужен общий кэш: CACHE_BACKEND=django.core.cache.backends.memcached.
+# PyMemcacheCache и CACHE_LOCATION=memcached:11211 (infra/example.env).
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default=LOCMEM_CACHE),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
+if PROFILE == 'prod' and CACHES['default']['BACKEND'] == LOCMEM_CACHE:
+    raise ImproperlyConfigured(
+        'В профиле prod нужен общий кэш (CACHE_BACKEND), а не '
+        'LocMemCache: у каждого воркера он свой.'
+    )
+
+# Множества id избранного, покупок и подписок пользователя: псевдоним
+# кэша из CACHES (локально LocMemCache, в работе Memcached).
+USER_FLAGS_CACHE = os.getenv('USER_FLAGS_CACHE', default='default')
+USER_FLAGS_TIMEOUT = int(os.getenv('USER_FLAGS_TIMEOUT', default=24 * 3600))
+
+# Кэш готовых ответов списка и карточки рецептов для анонимных
+# пользователей: время жизни записи, время жизни блокировки на сборку
+# ответа и сколько секунд ждать ответ, который собирает другой запрос.
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', default='True') == 'True'
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=24 * 3600)
+)
+RESPONSE_CACHE_LOCK_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT', default=10)
+)
+RESPONSE_CACHE_LOCK_WAIT = float(
+    os.getenv('RESPONSE_CACHE_LOCK_WAIT', default=0.5)
+)
+
+# Кэш токенов авторизации: размер и время жизни записей в процессе,
+# псевдоним общего кэша из CACHES. Выход, смену пароля и деактивацию
+# другие воркеры видят только через общий кэш, поэтому в prod он
+# включен, а записи в памяти процесса не хранятся.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TTL = int(
+    os.getenv('TOKEN_CACHE_TTL', default=0 if PROFILE == 'prod' else 60)
+)
+TOKEN_CACHE_SHARED = os.getenv(
+    'TOKEN_CACHE_SHARED', default='default' if PROFILE == 'prod' else ''
+) or None
+TOKEN_CACHE_SHARED_TTL = int(
+    os.getenv('TOKEN_CACHE_SHARED_TTL', default=600)
+)
+
+if PROFILE == 'test':
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -112,6 +238,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentHashStorage'
+
+# Изображения рецептов: предельный размер загрузки в байтах и размеры
+# уменьшенных копий в WebP, которые готовятся в фоновых потоках.
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', default=10 * 1024 * 1024)
+)
+IMAGE_VARIANTS = {
+    'list': (160, 160),
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -123,9 +263,18 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'SEARCH_PARAM': 'name',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
+
+# Автодополнение ингредиентов из списка в памяти процесса вместо
+# поиска в базе (SearchFilter).
+INGREDIENT_AUTOCOMPLETE = (
+    os.getenv('INGREDIENT_AUTOCOMPLETE', default='True') == 'True'
+)
+INGREDIENT_AUTOCOMPLETE_TTL = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_TTL', default=300)
+)
@@ -0,0 +1,56 @@
+"""Настройки gunicorn: gunicorn foodgram.wsgi -c gunicorn.conf.py
+
+Значения по умолчанию рассчитаны на число ядер и переопределяются
+переменными окружения GUNICORN_*. Модели воркеров:
+- gthread (по умолчанию) — процессы с пулом потоков, подходит для
+  запросов, которые ждут базу;
+- gevent — кооперативные зеленые потоки, psycopg2 переключается
+  в неблокирующий режим через psycogreen;
+- sync — один запрос на процесс;
+- uvicorn.workers.UvicornWorker — цикл событий asyncio, приложение
+  foodgram.asgi:application (GUNICORN_APP в entrypoint.sh),
+  асинхронные представления включаются ASYNC_READ_VIEWS=True.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', cores * 2 + 1))
+threads = int(os.getenv(
+    'GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1
+))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Приложение импортируется один раз в мастере, воркеры запускаются
+# быстрее и делят память. Кроме gevent: мастер загружает модули до того,
+# как воркер подменит threading, и блокировки вроде IngredientIndex._lock
+# остаются блокировками потоков. Зеленый поток, ждущий такую блокировку,
+# пока ее владелец ждет базу, останавливает весь воркер. Воркер
+# перезапускается после max_requests запросов, разброс не дает всем
+# перезапуститься одновременно.
+preload_app = (
+    worker_class != 'gevent'
+    and os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 90))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Пустое значение отключает журнал запросов.
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    if preload_app:
+        # Соединения, открытые в мастере при загрузке приложения,
+        # нельзя делить между процессами.
+        from django.db import connections
+        connections.close_all()
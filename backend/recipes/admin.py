@@ -47,7 +47,7 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
     def get_quantity_the_recipy_is_favorite(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     get_quantity_the_recipy_is_favorite.short_description = (
         'Количество пользователей, добавившее рецепт в избранное'
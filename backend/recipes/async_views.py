@@ -0,0 +1,143 @@
+"""Асинхронные версии самых частых запросов на чтение для ASGI.
+
+В Django 3.2 нет асинхронного ORM, поэтому обращения к базе идут через
+sync_to_async, а ответы из памяти процесса (автодополнение ингредиентов)
+отдаются без потока. Пока запрос ждет базу или медленного клиента,
+процесс uvicorn обслуживает другие соединения. Включаются настройкой
+ASYNC_READ_VIEWS, изменяющие запросы передаются синхронным ViewSet.
+
+ETag и ответ 304 те же, что у ConditionalGetMixin. Карточку рецепта
+для анонимного пользователя отдает ViewSet: у нее есть еще и кэш
+готовых ответов (ResponseCacheMixin), попадание обходится без базы.
+"""
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from users.authentication import CachedTokenAuthentication
+from .autocomplete import ingredient_index
+from .caching import conditional_validators, get_versions, set_validators
+from .filters import IngredientSearchFilter
+from .models import Recipe, Tag
+from .serializers import (
+    IngredientSerializer,
+    RecipeSafeSerializer,
+    TagSerializer
+)
+from .views import IngredientViewSet, RecipeViewSet, TagView
+
+READ_METHODS = ('GET', 'HEAD')
+RETRIEVE = SimpleNamespace(action='retrieve')
+
+ingredient_list_view = IngredientViewSet.as_view({'get': 'list'})
+recipe_detail_view = RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
+
+
+def render_json(data, status=200):
+    """Тот же JSON, что отдает DRF."""
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status
+    )
+
+
+async def conditional_get(request, resources, handler):
+    """ConditionalGetMixin.conditional_get для ответов в JSON."""
+    etag, last_modified = conditional_validators(
+        request, 'json', await sync_to_async(get_versions)(resources)
+    )
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = await handler(request)
+        if response.status_code != 200:
+            return response
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def read_only(view):
+    async def wrapped(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return HttpResponseNotAllowed(READ_METHODS)
+        return await view(request, *args, **kwargs)
+    return wrapped
+
+
+def serialize_tags():
+    return TagSerializer(Tag.objects.all(), many=True).data
+
+
+async def render_tags(request):
+    return render_json(await sync_to_async(serialize_tags)())
+
+
+@read_only
+async def tag_list(request):
+    return await conditional_get(
+        request, TagView.conditional_resources, render_tags
+    )
+
+
+async def search_ingredients(request):
+    name = request.GET.get(api_settings.SEARCH_PARAM, '')
+    if ingredient_index.is_fresh():
+        ingredients = ingredient_index.search(name)
+    else:
+        ingredients = await sync_to_async(ingredient_index.search)(name)
+    return render_json(IngredientSerializer(ingredients, many=True).data)
+
+
+@read_only
+async def ingredient_list(request):
+    if (
+        not settings.INGREDIENT_AUTOCOMPLETE
+        or IngredientSearchFilter.is_fuzzy(request.GET)
+    ):
+        return await sync_to_async(ingredient_list_view)(request)
+    return await conditional_get(
+        request, IngredientViewSet.conditional_resources, search_ingredients
+    )
+
+
+def serialize_recipe(request, pk):
+    request = Request(
+        request, authenticators=[CachedTokenAuthentication()]
+    )
+    recipe = Recipe.objects.for_read().filter(pk=pk).first()
+    if recipe is None:
+        raise NotFound()
+    return RecipeSafeSerializer(
+        recipe, context={'request': request, 'view': RETRIEVE}
+    ).data
+
+
+async def recipe_detail(request, pk):
+    if (
+        request.method not in READ_METHODS
+        or 'HTTP_AUTHORIZATION' not in request.META
+    ):
+        return await sync_to_async(recipe_detail_view)(request, pk=pk)
+    try:
+        data = await sync_to_async(serialize_recipe)(request, pk)
+    except APIException as error:
+        return render_json({'detail': error.detail}, error.status_code)
+    return render_json(data)
+
+
+# Изменения рецепта проверяют токен, а не CSRF, как и во ViewSet.
+recipe_detail.csrf_exempt = True
@@ -0,0 +1,71 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+# Верхняя граница диапазона ключей с общим префиксом.
+PREFIX_UPPER_BOUND = chr(0x10FFFF)
+
+
+class IngredientIndex:
+    """Ингредиенты в отсортированном списке для автодополнения.
+
+    Список загружается из базы один раз и перечитывается после изменения
+    ингредиентов в этом процессе или по истечении ttl секунд (изменения
+    в других процессах).
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = ([], [])
+        self._expires_at = 0
+
+    def invalidate(self):
+        self._expires_at = 0
+
+    def is_fresh(self):
+        """Поиск обойдется без обращения к базе."""
+        return time.monotonic() < self._expires_at
+
+    def _get_snapshot(self):
+        if time.monotonic() >= self._expires_at:
+            with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    self._load()
+        return self._snapshot
+
+    def _load(self):
+        items = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name.lower(), ingredient.id)
+        )
+        # Одно присваивание: читатели в других потоках видят либо старую
+        # пару, либо новую, но не ключи одной и объекты другой.
+        self._snapshot = (
+            [ingredient.name.lower() for ingredient in items], items
+        )
+        self._expires_at = time.monotonic() + self.ttl
+
+    def search(self, query):
+        """Точные совпадения, затем по началу названия, затем по вхождению."""
+        keys, items = self._get_snapshot()
+        query = query.strip().lower()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + PREFIX_UPPER_BOUND, start)
+        exact, prefix = [], []
+        for key, item in zip(keys[start:end], items[start:end]):
+            (exact if key == query else prefix).append(item)
+        infix = [
+            item for key, item in zip(keys, items)
+            if query in key and not key.startswith(query)
+        ]
+        return exact + prefix + infix
+
+
+ingredient_index = IngredientIndex(ttl=settings.INGREDIENT_AUTOCOMPLETE_TTL)
@@ -0,0 +1,131 @@
+"""Добавление и удаление избранного, покупок и подписок в обход сигналов.
+
+Существование объектов проверяется одним запросом id__in, записи
+добавляются одним INSERT ... ON CONFLICT DO NOTHING (повтор отсекает
+уникальный индекс) и удаляются одним DELETE ... RETURNING.
+Сигналы при этом не отправляются, поэтому счетчики, кэш отметок
+и суммы списка покупок обновляются здесь только для строк, которые
+действительно добавлены или удалены.
+"""
+from django.db import connection, transaction
+
+from users.models import User
+from .cart import change_cart
+from .flags import FLAG_SOURCES, invalidate_flag
+from .models import Recipe
+from .services import change_counter
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+# Множество отметок -> (модель объекта, счетчик объекта).
+TARGETS = {
+    'favorites': (Recipe, 'favorites_count'),
+    'cart': (Recipe, 'in_carts_count'),
+    'follows': (User, 'followers_count'),
+}
+
+
+def apply_changes(user, name, ids, delta):
+    """Счетчики, отметки и суммы покупок для добавленных или удаленных id."""
+    model, counter = TARGETS[name]
+    change_counter(model.objects.filter(id__in=ids), counter, delta)
+    if name == 'follows':
+        change_counter(
+            User.objects.filter(id=user.id), 'following_count',
+            delta * len(ids)
+        )
+    if name == 'cart':
+        change_cart(user.id, ids, delta)
+    invalidate_flag(user.id, name)
+
+
+def insert_new(user, name, object_ids):
+    """INSERT ... ON CONFLICT DO NOTHING, вернуть id вставленных объектов.
+
+    Без предварительного SELECT: одновременные запросы не получат
+    IntegrityError, каждую строку вставит только один из них.
+    """
+    model, attname = FLAG_SOURCES[name]
+    table = connection.ops.quote_name(model._meta.db_table)
+    values = ', '.join(['(%s, %s)'] * len(object_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, {attname}) VALUES {values} '
+            f'ON CONFLICT DO NOTHING RETURNING {attname}',
+            [param for pk in object_ids for param in (user.id, pk)]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+@transaction.atomic
+def add_one(user, name, object_id):
+    """Добавить запись, если ее еще нет; вернуть True, если добавлена."""
+    created = insert_new(user, name, [object_id])
+    if created:
+        apply_changes(user, name, created, 1)
+    return bool(created)
+
+
+@transaction.atomic
+def add_many(user, name, ids):
+    """Добавить записи, вернуть {id: статус}."""
+    found = set(TARGETS[name][0].objects.filter(
+        id__in=ids
+    ).values_list('id', flat=True))
+    if name == 'follows':
+        # На себя подписаться нельзя.
+        found.discard(user.id)
+    # Счетчики и суммы меняются только для вставленных строк: строки,
+    # добавленные параллельными запросами, пропускает ON CONFLICT.
+    created = insert_new(user, name, sorted(found)) if found else set()
+    if created:
+        apply_changes(user, name, created, 1)
+    statuses = {pk: ADDED for pk in created}
+    statuses.update({pk: EXISTS for pk in found - created})
+    if name == 'follows':
+        statuses[user.id] = INVALID
+    return {pk: statuses.get(pk, NOT_FOUND) for pk in ids}
+
+
+def delete_existing(user, name, object_ids):
+    """DELETE ... RETURNING, вернуть id удаленных объектов.
+
+    Из одновременных удалений одной строки ее вернет только одно:
+    остальные дождутся блокировки и строку уже не найдут.
+    """
+    model, attname = FLAG_SOURCES[name]
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(object_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE user_id = %s AND {attname} IN ({placeholders}) '
+            f'RETURNING {attname}',
+            [user.id, *object_ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+@transaction.atomic
+def remove_many(user, name, ids):
+    """Удалить записи, вернуть {id: статус}."""
+    # Один DELETE без выборки объектов и сигналов: на записи никто
+    # не ссылается, остальное обновляет apply_changes.
+    removed = delete_existing(user, name, ids) if ids else set()
+    if removed:
+        apply_changes(user, name, removed, -1)
+    return {pk: REMOVED if pk in removed else ABSENT for pk in ids}
+
+
+def remove_one(user, name, object_id):
+    """Удалить запись; вернуть True, если она была.
+
+    Из двух одновременных удалений одной записи счетчики и суммы
+    меняет только то, которое ее удалило.
+    """
+    return remove_many(user, name, [object_id])[object_id] == REMOVED
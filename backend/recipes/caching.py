@@ -0,0 +1,240 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers
+)
+from django.utils.http import http_date
+
+VERSION_KEY = 'resource-version:{}'
+RESPONSE_KEY = 'response:{}'
+RESPONSE_LOCK_KEY = 'response-lock:{}'
+RESPONSE_STATS_KEY = 'response-stats:{}'
+RESPONSE_OUTCOMES = ('hit', 'stale', 'miss')
+# Шаг опроса кэша, пока ответ собирает другой запрос.
+RESPONSE_WAIT_STEP = 0.05
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_versions(resources):
+    """Версии ресурсов: время последнего изменения в миллисекундах."""
+    keys = [VERSION_KEY.format(resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # После очистки кэша версия не должна совпасть со старой.
+            cache.add(key, _now_ms(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*resources):
+    keys = [VERSION_KEY.format(resource) for resource in resources]
+    versions = cache.get_many(keys)
+    now = _now_ms()
+    cache.set_many(
+        {key: max(now, versions.get(key, 0) + 1) for key in keys},
+        timeout=None
+    )
+
+
+def recipe_resource(recipe_id):
+    """Версия одного рецепта, от нее зависит кэш его карточки."""
+    return f'recipe:{recipe_id}'
+
+
+def author_resource(user_id):
+    """Версия пользователя, показанного автором в карточках рецептов."""
+    return f'author:{user_id}'
+
+
+def count_response(outcome):
+    key = RESPONSE_STATS_KEY.format(outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счетчик вытеснен из кэша между add и incr.
+        pass
+
+
+def response_cache_stats():
+    """Число попаданий, устаревших ответов и промахов кэша ответов."""
+    counts = cache.get_many(
+        [RESPONSE_STATS_KEY.format(outcome) for outcome in RESPONSE_OUTCOMES]
+    )
+    stats = {
+        outcome: counts.get(RESPONSE_STATS_KEY.format(outcome), 0)
+        for outcome in RESPONSE_OUTCOMES
+    }
+    total = sum(stats.values())
+    stats['hit_rate'] = (
+        round((stats['hit'] + stats['stale']) / total, 4) if total else None
+    )
+    return stats
+
+
+def conditional_validators(request, renderer_format, versions):
+    """ETag и Last-Modified ответа по версиям ресурсов."""
+    key = '|'.join([
+        request.get_full_path(), renderer_format, *map(str, versions)
+    ])
+    etag = '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+    return etag, max(versions) // 1000
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified по версиям ресурсов для list и retrieve.
+
+    Ответ 304 отдается до выборки из базы и сериализации.
+    """
+
+    conditional_resources = ()
+
+    def use_conditional_get(self, request):
+        return True
+
+    def conditional_get(self, handler, request, *args, **kwargs):
+        if not self.use_conditional_get(request):
+            return handler(request, *args, **kwargs)
+        etag, last_modified = conditional_validators(
+            request, request.accepted_renderer.format,
+            get_versions(self.conditional_resources)
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class ResponseCacheMixin:
+    """Готовые байты JSON list и retrieve для анонимных пользователей.
+
+    Запись хранит ответ и версии ресурсов, от которых он зависит
+    (response_resources). Запись устаревает, когда меняется любая из
+    версий: ее пересобирает запрос, получивший блокировку, остальные
+    тем временем получают устаревший ответ. Пока записи нет совсем,
+    остальные запросы ждут первого до RESPONSE_CACHE_LOCK_WAIT секунд.
+    """
+
+    def use_response_cache(self, request):
+        return (
+            settings.RESPONSE_CACHE
+            and request.user.is_anonymous
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def response_resources(self, request, *args, **kwargs):
+        return list(self.conditional_resources)
+
+    def response_cache_key(self, request):
+        # Порядок параметров и повторяющихся значений не важен.
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+        )
+        key = json.dumps(
+            [request.get_host(), request.path, self.action, params]
+        )
+        return RESPONSE_KEY.format(hashlib.sha1(key.encode()).hexdigest())
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.use_response_cache(request):
+            return handler(request, *args, **kwargs)
+        key = self.response_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and (
+            entry['versions'] == get_versions(entry['resources'])
+        ):
+            return self.entry_response(entry, 'hit')
+        lock = RESPONSE_LOCK_KEY.format(key)
+        if cache.add(lock, 1, timeout=settings.RESPONSE_CACHE_LOCK_TIMEOUT):
+            try:
+                return self.store_response(
+                    key, handler, request, *args, **kwargs
+                )
+            finally:
+                cache.delete(lock)
+        if entry is not None:
+            return self.entry_response(entry, 'stale')
+        entry = self.wait_for_entry(key)
+        if entry is not None:
+            return self.entry_response(entry, 'hit')
+        # Не дождались: ответ собирается без блокировки.
+        return self.store_response(key, handler, request, *args, **kwargs)
+
+    def wait_for_entry(self, key):
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(RESPONSE_WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def entry_response(self, entry, outcome):
+        count_response(outcome)
+        response = HttpResponse(
+            entry['body'], content_type=entry['content_type']
+        )
+        response['X-Cache'] = outcome.upper()
+        return response
+
+    def store_response(self, key, handler, request, *args, **kwargs):
+        # Версии берутся до сборки ответа: изменение во время сборки
+        # сделает запись устаревшей, а не спрячет ее.
+        resources = self.response_resources(request, *args, **kwargs)
+        versions = get_versions(resources)
+        response = handler(request, *args, **kwargs)
+        count_response('miss')
+        if response.status_code != 200:
+            return response
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        cache.set(key, {
+            'resources': resources,
+            'versions': versions,
+            'body': response.content,
+            'content_type': response['Content-Type'],
+        }, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,92 @@
+"""Суммы ингредиентов в списках покупок (ShoppingCartItem).
+
+Вместо JOIN и GROUP BY по всем рецептам списка при каждой выгрузке
+суммы хранятся по ключу (пользователь, ингредиент) и меняются
+на разницу: при добавлении и удалении рецепта из списка покупок
+и при правке ингредиентов рецепта. Изменение выполняется одним
+INSERT ... ON CONFLICT DO UPDATE (PostgreSQL и SQLite), в Django 3.2
+bulk_create не умеет обновлять конфликтующие строки.
+"""
+from django.db import connection, transaction
+
+from .models import IngredientAmount, ShoppingCartItem, ShoppingList
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def upsert(select, params, many=False):
+    """Прибавить к суммам строки (user_id, ingredient_id, amount) из select.
+
+    WHERE в select обязателен: без него SQLite принимает ON CONFLICT
+    за условие соединения.
+    """
+    items = table(ShoppingCartItem)
+    sql = (
+        f'INSERT INTO {items} (user_id, ingredient_id, amount) {select} '
+        f'ON CONFLICT (user_id, ingredient_id) '
+        f'DO UPDATE SET amount = {items}.amount + excluded.amount'
+    )
+    with connection.cursor() as cursor:
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params)
+
+
+def change_cart(user_id, recipe_ids, sign):
+    """Прибавить ингредиенты рецептов к списку покупок (sign=1) или вычесть."""
+    recipe_ids = list(recipe_ids)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    upsert(
+        f'SELECT %s, ingredient_id, SUM(amount) * %s '
+        f'FROM {table(IngredientAmount)} '
+        f'WHERE recipe_id IN ({placeholders}) GROUP BY ingredient_id',
+        [user_id, sign, *recipe_ids]
+    )
+    if sign < 0:
+        ShoppingCartItem.objects.filter(
+            user_id=user_id, amount__lte=0
+        ).delete()
+
+
+def apply_recipe_changes(recipe_id, deltas):
+    """Разница {ingredient_id: количество} во всех списках с рецептом."""
+    if not deltas or not ShoppingList.objects.filter(
+        recipe_id=recipe_id
+    ).exists():
+        return
+    upsert(
+        f'SELECT user_id, %s, %s FROM {table(ShoppingList)} '
+        f'WHERE recipe_id = %s',
+        [
+            (ingredient_id, delta, recipe_id)
+            for ingredient_id, delta in deltas.items()
+        ],
+        many=True
+    )
+    shrunk = [
+        ingredient_id for ingredient_id, delta in deltas.items() if delta < 0
+    ]
+    if shrunk:
+        ShoppingCartItem.objects.filter(
+            ingredient_id__in=shrunk, amount__lte=0
+        ).delete()
+
+
+@transaction.atomic
+def rebuild_carts():
+    """Пересобрать все суммы из списков покупок, вернуть число строк."""
+    ShoppingCartItem.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table(ShoppingCartItem)} '
+            f'(user_id, ingredient_id, amount) '
+            f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+            f'FROM {table(ShoppingList)} cart '
+            f'JOIN {table(IngredientAmount)} item '
+            f'ON item.recipe_id = cart.recipe_id '
+            f'GROUP BY cart.user_id, item.ingredient_id'
+        )
+        return cursor.rowcount
@@ -1,15 +1,54 @@
 import base64
+import binascii
+import hashlib
+import re
+import tempfile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
 from rest_framework import serializers
 
+# Количество символов base64, декодируемых за один шаг (кратно 4).
+DECODE_CHUNK = 64 * 1024
+# Переводы строк и пробелы (base64 в формате MIME): без них части
+# не разрезают четверки символов. Прочие посторонние символы остаются
+# и отклоняются b64decode(validate=True).
+WHITESPACE = re.compile(r'\s')
+
 
 class Base64ImageField(serializers.ImageField):
-    """Для работы с изобажениями (перевод в base64)."""
+    """Для работы с изобажениями (перевод в base64).
+
+    Изображение декодируется по частям во временный файл и получает
+    имя по хешу содержимого, поэтому повторная загрузка не создает копию.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format_, imgstr = data.split(';base64,')
             ext = format_.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, ext)
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, ext):
+        imgstr = WHITESPACE.sub('', imgstr)
+        max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+        if len(imgstr) * 3 // 4 > max_size:
+            self.fail('too_large', max_size=max_size)
+        digest = hashlib.sha256()
+        file = tempfile.SpooledTemporaryFile(max_size=DECODE_CHUNK * 4)
+        for start in range(0, len(imgstr), DECODE_CHUNK):
+            try:
+                chunk = base64.b64decode(
+                    imgstr[start:start + DECODE_CHUNK], validate=True
+                )
+            except binascii.Error:
+                self.fail('invalid_image')
+            digest.update(chunk)
+            file.write(chunk)
+        file.seek(0)
+        return File(file, name=f'{digest.hexdigest()}.{ext}')
@@ -1,13 +1,28 @@
 import django_filters as filters
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity
+)
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q
+from rest_framework.filters import SearchFilter
 
-from .models import Recipe, Tag
+from .models import Favorite, Recipe, ShoppingList, Tag
 
 
 class RecipeFilter(filters.FilterSet):
+    """Фильтры ленты рецептов.
+
+    Теги, избранное и покупки проверяются подзапросами EXISTS: соединение
+    дало бы повторы рецептов, а их удаление потребовало бы DISTINCT.
+    """
+
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
+        method='get_tags'
     )
     is_favorited = filters.NumberFilter(
         method='get_is_favorited'
@@ -20,14 +35,77 @@ class RecipeFilter(filters.FilterSet):
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
-    def get_is_favorited(self, queryset, name, value):
+    def get_tags(self, queryset, name, tags):
+        if not tags:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=tags
+        )))
+
+    def filter_user_recipes(self, queryset, model, value):
+        if not value:
+            return queryset
         user = self.request.user
-        if value:
-            return queryset.filter(favorites__user=user)
-        return Recipe.objects.all()
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_user_recipes(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return queryset.filter(purchases__user=user)
-        return Recipe.objects.all()
+        return self.filter_user_recipes(queryset, ShoppingList, value)
+
+
+class IngredientSearchFilter(SearchFilter):
+    """Поиск по началу названия или нечеткий поиск при ?fuzzy=1.
+
+    Нечеткий поиск использует pg_trgm и сортирует по похожести,
+    на других базах он сводится к поиску по вхождению.
+    """
+
+    fuzzy_param = 'fuzzy'
+
+    @classmethod
+    def is_fuzzy(cls, params):
+        return params.get(cls.fuzzy_param) in ('1', 'true')
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or not self.is_fuzzy(request.query_params):
+            return super().filter_queryset(request, queryset, view)
+        if connection.vendor != 'postgresql':
+            return queryset.filter(name__icontains=name)
+        return queryset.filter(name__trigram_similar=name).annotate(
+            similarity=TrigramSimilarity('name', name)
+        ).order_by('-similarity', 'name')
+
+
+class RecipeSearchFilter(SearchFilter):
+    """Полнотекстовый поиск по названию и описанию рецепта.
+
+    В PostgreSQL запрос разбирается как в поисковиках (websearch)
+    и ищется по search_vector с GIN-индексом, результаты сортируются
+    по SearchRank. На других базах поиск сводится к вхождению строки.
+    """
+
+    # SEARCH_PARAM в настройках занят поиском ингредиентов по ?name=.
+    search_param = 'search'
+    config = 'russian'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=text) | Q(text__icontains=text)
+            )
+        query = SearchQuery(
+            text, config=self.config, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
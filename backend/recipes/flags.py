@@ -0,0 +1,87 @@
+"""Множества id избранного, покупок и подписок пользователя в кэше.
+
+Карточка рецепта проверяет принадлежность id множеству вместо запроса
+к базе. Множества читаются из базы одним запросом при первом обращении.
+При добавлении и удалении записей множество сбрасывается и читается
+заново при следующем обращении: изменение на месте (прочитать, изменить,
+записать) теряет одно из двух одновременных переключений.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import CharField, Value
+
+from users.models import Follow
+from .models import Favorite, ShoppingList
+
+# Название множества -> (модель записи, поле с id объекта).
+FLAG_SOURCES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'cart': (ShoppingList, 'recipe_id'),
+    'follows': (Follow, 'author_id'),
+}
+EMPTY_FLAGS = {name: frozenset() for name in FLAG_SOURCES}
+
+
+def get_flags_cache():
+    return caches[settings.USER_FLAGS_CACHE]
+
+
+def flag_key(user_id, name):
+    return f'user-flags:{user_id}:{name}'
+
+
+def load_flags(user_id, names):
+    """Множества из базы одним запросом UNION ALL."""
+    querysets = [
+        FLAG_SOURCES[name][0].objects.filter(user_id=user_id).annotate(
+            flag=Value(name, output_field=CharField())
+        ).values_list(FLAG_SOURCES[name][1], 'flag').order_by()
+        for name in names
+    ]
+    flags = {name: set() for name in names}
+    for object_id, name in querysets[0].union(*querysets[1:], all=True):
+        flags[name].add(object_id)
+    return {name: frozenset(ids) for name, ids in flags.items()}
+
+
+def get_user_flags(user):
+    if not user.is_authenticated:
+        return EMPTY_FLAGS
+    cache = get_flags_cache()
+    keys = {flag_key(user.id, name): name for name in FLAG_SOURCES}
+    flags = {
+        keys[key]: ids for key, ids in cache.get_many(list(keys)).items()
+    }
+    missing = [name for name in FLAG_SOURCES if name not in flags]
+    if missing:
+        loaded = load_flags(user.id, missing)
+        cache.set_many(
+            {flag_key(user.id, name): ids for name, ids in loaded.items()},
+            settings.USER_FLAGS_TIMEOUT
+        )
+        flags.update(loaded)
+    return flags
+
+
+def context_flags(context):
+    """Множества пользователя запроса, одни на весь ответ сериализатора."""
+    if 'user_flags' not in context:
+        context['user_flags'] = get_user_flags(context['request'].user)
+    return context['user_flags']
+
+
+def forget_flag(user_id, name):
+    get_flags_cache().delete(flag_key(user_id, name))
+
+
+def invalidate_flag(user_id, name):
+    forget_flag(user_id, name)
+    # Повторно после коммита: множество могли прочитать до коммита.
+    transaction.on_commit(lambda: forget_flag(user_id, name))
+
+
+def clear_user_flags(user_id):
+    get_flags_cache().delete_many(
+        [flag_key(user_id, name) for name in FLAG_SOURCES]
+    )
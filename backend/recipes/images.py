@@ -0,0 +1,76 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .caching import bump_version, recipe_resource
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-variants'
+)
+
+
+def variant_name(name, variant):
+    return f'{os.path.splitext(name)[0]}_{variant}.webp'
+
+
+def make_variants(name):
+    """Уменьшенные копии изображения в WebP для всех IMAGE_VARIANTS.
+
+    Оригинал декодируется, только если какой-то копии нет; возвращает
+    True, если копии созданы.
+    """
+    missing = {
+        variant: size for variant, size in settings.IMAGE_VARIANTS.items()
+        if not default_storage.exists(variant_name(name, variant))
+    }
+    if not missing:
+        return False
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for variant, size in missing.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+        default_storage.save(
+            variant_name(name, variant), ContentFile(buffer.getvalue())
+        )
+    return True
+
+
+def _make_variants_logged(name, recipe_id):
+    try:
+        created = make_variants(name)
+    except Exception:
+        logger.exception('Не удалось подготовить копии изображения %s', name)
+        return
+    if created:
+        # В ответах адрес оригинала меняется на адрес копии.
+        bump_version('recipes', recipe_resource(recipe_id))
+
+
+def schedule_variants(name, recipe_id):
+    """Подготовить копии в фоновом потоке после коммита транзакции."""
+    transaction.on_commit(
+        lambda: executor.submit(_make_variants_logged, name, recipe_id)
+    )
+
+
+def variant_url(image, variant):
+    """Адрес копии нужного размера или оригинала, пока копии нет."""
+    name = variant_name(image.name, variant)
+    if default_storage.exists(name):
+        return default_storage.url(name)
+    return image.url
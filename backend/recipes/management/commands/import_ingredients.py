@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.autocomplete import ingredient_index
+from recipes.caching import bump_version
+from recipes.models import Ingredient
+
+FORMATS = ('csv', 'json')
+# Количество символов JSON, читаемых из файла за раз.
+JSON_CHUNK = 64 * 1024
+# Пробелы и запятые между элементами массива JSON.
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file):
+    """Объекты массива JSON по одному, файл читается частями."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON должен содержать массив объектов.')
+    position = 1
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Объект обрезан концом прочитанной части.
+            chunk = file.read(JSON_CHUNK)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def read_rows(path, file_format):
+    """Пары (название, единица измерения) из файла.
+
+    CSV читается построчно, JSON — по одному объекту: это массив объектов
+    {name, measurement_unit} или фикстура dumpdata с теми же полями в fields.
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            rows = (row for row in csv.reader(file) if row)
+        else:
+            rows = (
+                (item['name'], item['measurement_unit'])
+                for item in (
+                    item.get('fields', item) for item in iter_json_array(file)
+                )
+            )
+        for name, measurement_unit in rows:
+            yield name.strip(), measurement_unit.strip()
+
+
+def unique_rows(rows, seen):
+    """Строки без повторов, в том числе уже имеющихся в базе."""
+    for row in rows:
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+class Command(BaseCommand):
+    help = 'Загрузить ингредиенты из CSV или JSON, пропуская уже имеющиеся.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с ингредиентами.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT или COPY.'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='PostgreSQL: COPY во временную таблицу и один INSERT.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.')
+        )
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy работает только с PostgreSQL.')
+
+        started = time.perf_counter()
+        seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+        rows = unique_rows(read_rows(path, file_format), seen)
+        load = self.copy_rows if options['copy'] else self.insert_rows
+        with transaction.atomic():
+            # ignore_conflicts пропускает строки, добавленные параллельно,
+            # поэтому считаются строки в таблице, а не в файле.
+            count = Ingredient.objects.count()
+            load(rows, options['batch_size'])
+            created = Ingredient.objects.count() - count
+        elapsed = time.perf_counter() - started
+
+        # Массовая вставка не отправляет post_save.
+        ingredient_index.invalidate()
+        bump_version('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено ингредиентов: {created} за {elapsed:.2f} с '
+            f'({created / elapsed if elapsed else 0:.0f} строк/с)'
+        ))
+
+    def insert_rows(self, rows, batch_size):
+        for batch in batches(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ],
+                ignore_conflicts=True,
+            )
+
+    def copy_rows(self, rows, batch_size):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(20)) '
+                'ON COMMIT DROP'
+            )
+            for batch in batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH CSV', buffer
+                )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cart import rebuild_carts
+from recipes.services import recount_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитать счетчики избранного, покупок, рецептов и подписок '
+        'и суммы ингредиентов в списках покупок.'
+    )
+
+    def handle(self, *args, **options):
+        recipes, users = recount_counters()
+        cart_items = rebuild_carts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}, '
+            f'строк в списках покупок: {cart_items}'
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+# Таблица связи рецептов и тегов создается Django, поэтому индекс
+# (tag_id, recipe_id) для фильтра по тегам добавляется SQL-запросом.
+TAG_INDEX = 'recipes_recipe_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'recipe'], name='favorite_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglist',
+            index=models.Index(fields=['user', 'recipe'], name='shopping_list_user_recipe_idx'),
+        ),
+        migrations.RunSQL(
+            f'CREATE INDEX IF NOT EXISTS {TAG_INDEX} '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            f'DROP INDEX IF EXISTS {TAG_INDEX}',
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_cart_items(apps, schema_editor):
+    """Суммы для уже существующих списков покупок."""
+    quote = schema_editor.connection.ops.quote_name
+    items, carts, amounts = (
+        quote(apps.get_model('recipes', name)._meta.db_table)
+        for name in ('ShoppingCartItem', 'ShoppingList', 'IngredientAmount')
+    )
+    schema_editor.execute(
+        f'INSERT INTO {items} (user_id, ingredient_id, amount) '
+        f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+        f'FROM {carts} cart JOIN {amounts} item '
+        f'ON item.recipe_id = cart.recipe_id '
+        f'GROUP BY cart.user_id, item.ingredient_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_ingredient_recipe_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='shopping_cart_item_user_ingredient_unique'),
+        ),
+        migrations.RunPython(fill_cart_items, migrations.RunPython.noop),
+    ]
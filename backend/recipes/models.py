@@ -1,5 +1,15 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import (
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Subquery
+)
 
 from users.models import User
 
@@ -49,11 +59,72 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        # Индексы для поиска по началу названия и нечеткого поиска
+        # создаются в миграции 0005 только для PostgreSQL.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='ingredient_name_unit_unique'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name} -> {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для чтения без запросов на каждую строку."""
+
+    def with_related(self):
+        """Автор, теги и ингредиенты одним набором запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipes_ingredients_list',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def by_ingredients(self, ingredients, max_missing=None):
+        """Рецепты хотя бы с одним из ингредиентов, лучшие совпадения первыми.
+
+        IngredientAmount служит обратным индексом «ингредиент → рецепты»:
+        кандидаты выбираются по индексу (ingredient, recipe), для каждого
+        подзапросами считаются все его ингредиенты и имеющиеся. coverage —
+        доля имеющихся, missing — число недостающих ингредиентов.
+        """
+        amounts = IngredientAmount.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe')
+        queryset = self.filter(id__in=IngredientAmount.objects.filter(
+            ingredient__in=ingredients
+        ).values('recipe')).annotate(
+            total_ingredients=Subquery(
+                amounts.annotate(count=Count('id')).values('count')
+            ),
+            matched_ingredients=Subquery(
+                amounts.filter(ingredient__in=ingredients).annotate(
+                    count=Count('id')
+                ).values('count')
+            ),
+        ).annotate(
+            missing=F('total_ingredients') - F('matched_ingredients'),
+            coverage=ExpressionWrapper(
+                F('matched_ingredients') * 1.0 / F('total_ingredients'),
+                output_field=FloatField()
+            ),
+        )
+        if max_missing is not None:
+            queryset = queryset.filter(missing__lte=max_missing)
+        return queryset.order_by('-coverage', 'missing', '-pub_date', '-id')
+
+    def for_read(self):
+        # Отметки пользователя берутся из кэша, см. recipes.flags.
+        return self.with_related().defer('search_vector')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -93,11 +164,41 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1, 'Значение не может быть меньше 1')],
         verbose_name='Время готовки в минутах',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    # Заполняется триггером PostgreSQL из названия и описания,
+    # GIN-индекс создается в миграции 0008.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            # Ключ курсорной пагинации ленты.
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            # Последние рецепты автора в подписках (?recipes_limit=).
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -124,6 +225,12 @@ class Favorite(models.Model):
                 name='favorite_recipe_user_unique'
             )
         ]
+        indexes = [
+            # Фильтр и отметки ищут рецепт среди записей пользователя.
+            models.Index(
+                fields=['user', 'recipe'], name='favorite_user_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} -> {self.recipe.name}'
@@ -151,6 +258,12 @@ class ShoppingList(models.Model):
                 name='shopping_list_recipe_user_unique'
             )
         ]
+        indexes = [
+            # Фильтр и отметки ищут рецепт среди записей пользователя.
+            models.Index(
+                fields=['user', 'recipe'], name='shopping_list_user_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'У пользователя {self.user} покупки: {self.recipe}'
@@ -178,6 +291,51 @@ class IngredientAmount(models.Model):
     class Meta:
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
+        indexes = [
+            # Обратный индекс для поиска рецептов по ингредиентам.
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_amount_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} {self.amount}  в рецепте {self.recipe}'
+
+
+class ShoppingCartItem(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок пользователя.
+
+    Поддерживается recipes.cart при добавлении и удалении рецептов
+    из списка покупок и при правке их ингредиентов, пересобирается
+    командой recount.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Ингредиент'
+    )
+    # Без ограничения на знак: при обновлении сумма может на время
+    # уйти в минус, такие строки сразу удаляются.
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='shopping_cart_item_user_ingredient_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
@@ -0,0 +1,228 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Начиная с этого размера таблицы общее количество строк без фильтров
+# берется из статистики PostgreSQL вместо COUNT(*).
+ESTIMATE_COUNT_FROM = 10000
+
+
+def estimate_count(queryset):
+    """Приблизительное количество строк или None, если оценки нет.
+
+    Оценка есть только для PostgreSQL и запроса без условий: тогда
+    количество строк равно размеру таблицы из pg_class.reltuples.
+    """
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < ESTIMATE_COUNT_FROM:
+        return None
+    return row[0]
+
+
+def fast_count(queryset):
+    estimate = estimate_count(queryset)
+    return queryset.count() if estimate is None else estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который не считает большие таблицы целиком."""
+
+    @cached_property
+    def count(self):
+        return fast_count(self.object_list)
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки без OFFSET.
+
+    Курсор хранит значения полей сортировки последней (или первой)
+    записи страницы, следующая страница выбирается условием
+    (pub_date, id) < (курсор) по составному индексу. Общее количество
+    записей возвращается только по запросу ?count=1.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, page_size, ordering=None):
+        self.page_size = page_size
+        if ordering:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        position, self.reverse = self.decode_cursor(request)
+        if position is not None:
+            position = self.parse_position(queryset.model, position)
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = fast_count(queryset)
+
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, self.reverse))
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.invert(field) for field in ordering]
+        page = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = page
+        return page
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def seek(self, position, reverse):
+        """Условие «строго после курсора» в порядке сортировки."""
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            equal = {
+                key.lstrip('-'): value
+                for key, value in zip(self.ordering[:index], position)
+            }
+            conditions.append(Q(**equal, **{lookup: position[index]}))
+        return reduce(or_, conditions)
+
+    def position(self, instance):
+        return [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_position(self, model, position):
+        """Значения курсора в типах полей сортировки.
+
+        Курсор приходит от клиента, поэтому неподходящие значения
+        дают 404, а не ошибку базы при фильтрации.
+        """
+        values = []
+        for field, value in zip(self.ordering, position):
+            try:
+                value = model._meta.get_field(
+                    field.lstrip('-')
+                ).to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, instance, reverse=False):
+        cursor = {'p': self.position(instance)}
+        if reverse:
+            cursor['r'] = 1
+        # str() сохраняет микросекунды, которые DjangoJSONEncoder отбросил бы.
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(cursor, default=str).encode()
+        ).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(
+                remove_query_param(self.base_url, self.cursor_query_param),
+                self.cursor_query_param, ''
+            )
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class FeedPagination(PageNumberPagination):
+    """Постраничная пагинация ?page=&limit= и курсорная по ?cursor=.
+
+    Курсорный режим включается самим параметром, для первой страницы
+    достаточно пустого ?cursor=. Порядок курсора задается атрибутом
+    cursor_ordering представления. Запросы со своей сортировкой
+    (ранг поиска, покрытие ингредиентами) по курсору не листаются:
+    для них ?cursor= отдает обычные страницы.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    page_size_query_param = 'limit'
+    max_page_size = KeysetPagination.max_page_size
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = (
+            getattr(view, 'cursor_ordering', None)
+            or KeysetPagination.ordering
+        )
+        own_ordering = tuple(queryset.query.order_by)
+        if (
+            KeysetPagination.cursor_query_param not in request.query_params
+            or own_ordering and own_ordering != tuple(ordering)
+        ):
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(self.get_page_size(request), ordering)
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,18 +1,33 @@
+from collections import Counter
+
+from django.core.files import File
+from django.db import transaction
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
-from users.models import User
 from users.serializers import UserSerializer
 
+from .caching import bump_version, recipe_resource
+from .cart import apply_recipe_changes
 from .fields import Base64ImageField
+from .flags import context_flags
+from .images import variant_url
 from .models import (
-    Favorite,
     Ingredient,
     IngredientAmount,
     Recipe,
-    ShoppingList,
+    ShoppingCartItem,
     Tag
 )
+from .storage import same_content
+
+BATCH_MAX_IDS = 100
+
+
+def is_unchanged(current, value):
+    """Значение поля не меняется; изображение — по хешу содержимого."""
+    if isinstance(value, File):
+        return same_content(current, value)
+    return current == value
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -54,6 +69,14 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ShoppingCartItemSerializer(IngredientAmountSerializer):
+    """Ингредиент списка покупок с суммой по всем рецептам."""
+
+    class Meta:
+        model = ShoppingCartItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class AddToIngredientAmountSerializer(serializers.ModelSerializer):
     """Serializer для ингредиентов RecipeFullSerializer"""
 
@@ -73,6 +96,7 @@ class RecipeSafeSerializer(serializers.ModelSerializer):
 
     author = UserSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
+    image = serializers.SerializerMethodField()
 
     is_favorited = serializers.SerializerMethodField(
         method_name='get_is_favorited'
@@ -99,25 +123,63 @@ class RecipeSafeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
-    def get_is_favorited(self, recipe):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and Favorite.objects.filter(recipe=recipe, user=user).exists()
+    def get_image(self, recipe):
+        view = self.context.get('view')
+        variant = (
+            'detail' if getattr(view, 'action', None) == 'retrieve'
+            else 'card'
         )
+        return self.context['request'].build_absolute_uri(
+            variant_url(recipe.image, variant)
+        )
+
+    def get_is_favorited(self, recipe):
+        return recipe.id in context_flags(self.context)['favorites']
 
     def get_is_in_shopping_cart(self, recipe):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and ShoppingList.objects.filter(recipe=recipe, user=user).exists()
-        )
+        return recipe.id in context_flags(self.context)['cart']
 
     def get_ingredients(self, recipe):
         queryset = recipe.recipes_ingredients_list.all()
         return IngredientAmountSerializer(queryset, many=True).data
 
 
+class RecipeCoverageSerializer(RecipeSafeSerializer):
+    """Рецепт с долей имеющихся ингредиентов."""
+
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSafeSerializer.Meta):
+        fields = RecipeSafeSerializer.Meta.fields + ('coverage', 'missing')
+
+
+class RecipeByIngredientsSerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0, required=False, allow_null=True
+    )
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Список id для пакетного добавления и удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_IDS
+    )
+
+    def validate_ids(self, ids):
+        # Повторы не меняют результат, порядок сохраняется для ответа.
+        return list(dict.fromkeys(ids))
+
+
 class RecipeFullSerializer(serializers.ModelSerializer):
     """Для методов отличных от SAFE_METHODS"""
 
@@ -149,6 +211,8 @@ class RecipeFullSerializer(serializers.ModelSerializer):
             recipe=recipe,
             amount=ingredient['amount']
         ) for ingredient in ingredients_data])
+        # bulk_create не отправляет post_save.
+        bump_version('recipes', recipe_resource(recipe.id))
 
     def create(self, validated_data):
         # Делаем селекцию данных
@@ -164,29 +228,86 @@ class RecipeFullSerializer(serializers.ModelSerializer):
         self.__ingredient_amount_bulk_create(recipe, ingredients_data)
         return recipe
 
+    @staticmethod
+    def __ingredient_amount_update(recipe, ingredients_data):
+        """Привести ингредиенты рецепта к ingredients_data минимумом записей.
+
+        Возвращает изменения количества по id ингредиента.
+        """
+        amounts = Counter()
+        for ingredient in ingredients_data:
+            amounts[ingredient['ingredient'].id] += ingredient['amount']
+        old_amounts = Counter()
+        existing = {}
+        to_delete = []
+        for row in recipe.recipes_ingredients_list.all():
+            old_amounts[row.ingredient_id] += row.amount
+            if (
+                row.ingredient_id in existing
+                or row.ingredient_id not in amounts
+            ):
+                to_delete.append(row.id)
+            else:
+                existing[row.ingredient_id] = row
+        to_update = [
+            row for row in existing.values()
+            if row.amount != amounts[row.ingredient_id]
+        ]
+        for row in to_update:
+            row.amount = amounts[row.ingredient_id]
+        to_create = [
+            IngredientAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+
+        if to_delete:
+            IngredientAmount.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientAmount.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientAmount.objects.bulk_create(to_create)
+        if to_update or to_create:
+            # bulk_update и bulk_create не отправляют post_save.
+            bump_version('recipes', recipe_resource(recipe.id))
+        amounts.subtract(old_amounts)
+        return {
+            ingredient_id: delta for ingredient_id, delta in amounts.items()
+            if delta
+        }
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
         # Делаем селекцию данных
-        ingredients_data = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-
-        # Удаляем старые объекты
-        IngredientAmount.objects.filter(recipe=recipe).delete()
-        # Создаем новые объекты
-        self.__ingredient_amount_bulk_create(recipe, ingredients_data)
-
-        recipe.name = validated_data.pop('name')
-        recipe.text = validated_data.pop('text')
-        recipe.cooking_time = validated_data.pop('cooking_time')
-
-        if validated_data.get('image'):
-            recipe.image = validated_data.pop('image')
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+
+        # Пишем только изменившиеся ингредиенты, разницу переносим
+        # в списки покупок, где есть рецепт
+        if ingredients_data is not None:
+            apply_recipe_changes(
+                recipe.id,
+                self.__ingredient_amount_update(recipe, ingredients_data)
+            )
 
-        recipe.save()
-        recipe.tags.set(tags_data)
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if not is_unchanged(getattr(recipe, field), value)
+        ]
+        for field in changed_fields:
+            setattr(recipe, field, validated_data[field])
+        if changed_fields:
+            recipe.save(update_fields=changed_fields)
+
+        # set() добавляет и удаляет только отличающиеся теги
+        if tags_data is not None:
+            recipe.tags.set(tags_data)
         return recipe
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = self.initial_data.get('ingredients', [])
         for ingredient in ingredients:
             if int(ingredient['amount']) <= 0:
                 raise serializers.ValidationError({
@@ -203,53 +324,6 @@ class RecipeFullSerializer(serializers.ModelSerializer):
         ).data
 
 
-class FavoriteShoppingWriteSerializer(serializers.ModelSerializer):
-    """Родительский класс для добавления в список покупок и избранное."""
-
-    recipe = serializers.SlugRelatedField(
-        slug_field='id',
-        queryset=Recipe.objects.all(),
-    )
-    user = serializers.SlugRelatedField(
-        slug_field='id',
-        queryset=User.objects.all(),
-    )
-
-    class Meta:
-        model = ShoppingList
-        fields = ('user', 'recipe')
-
-
-class ShoppingListWriteSerializer(FavoriteShoppingWriteSerializer):
-    """Запись в список покупок."""
-
-    class Meta:
-        model = ShoppingList
-        fields = FavoriteShoppingWriteSerializer.Meta.fields
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingList.objects.all(),
-                fields=['user', 'recipe'],
-                message="Уже добавлен!"
-            )
-        ]
-
-
-class FavoriteWriteSerializer(FavoriteShoppingWriteSerializer):
-    """Запись рецептов в избранное."""
-
-    class Meta:
-        model = Favorite
-        fields = FavoriteShoppingWriteSerializer.Meta.fields
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=['user', 'recipe'],
-                message="Уже добавлен!"
-            )
-        ]
-
-
 class FavoriteShoppingReturnSerializer(serializers.ModelSerializer):
     """Для ответа при дабовление в избранное."""
 
@@ -1,13 +1,91 @@
+import csv
+import json
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Follow, User
+from .models import Favorite, Recipe, ShoppingList
+
 START_COUNT_WITH = 1
+# Размер порции строк, читаемых курсором на стороне сервера.
+SHOPPING_CHUNK_SIZE = 500
 
 
-def get_ingredient_for_shopping(ingredient_and_amount):
-    """Составить список покупок."""
-    shopping_list = []
+def iter_shopping_txt(ingredient_and_amount):
+    """Список покупок построчно в виде нумерованного текста."""
     for i, item in enumerate(ingredient_and_amount, START_COUNT_WITH):
         name = item.get('ingredient__name')
         amount = str(item.get('ingredient_amount'))
         measurement_unit = item.get('ingredient__measurement_unit')
-        ingredient_row = f'{i}) {name} {amount} {measurement_unit}\n'
-        shopping_list.append(ingredient_row)
-    return shopping_list
+        yield f'{i}) {name} {amount} {measurement_unit}\n'
+
+
+class _Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_shopping_csv(ingredient_and_amount):
+    """Список покупок построчно в формате CSV."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for item in ingredient_and_amount:
+        yield writer.writerow((
+            item.get('ingredient__name'),
+            item.get('ingredient_amount'),
+            item.get('ingredient__measurement_unit'),
+        ))
+
+
+def iter_shopping_json(ingredient_and_amount):
+    """Список покупок по частям в виде JSON-массива."""
+    separator = '['
+    for item in ingredient_and_amount:
+        yield separator + json.dumps({
+            'name': item.get('ingredient__name'),
+            'amount': item.get('ingredient_amount'),
+            'measurement_unit': item.get('ingredient__measurement_unit'),
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_EXPORTERS = {
+    'txt': iter_shopping_txt,
+    'csv': iter_shopping_csv,
+    'json': iter_shopping_json,
+}
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно изменить счетчик F-выражением на стороне базы."""
+    if delta < 0:
+        # Счетчик не уходит ниже нуля, даже если он разошелся с данными.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def count_related(model, field):
+    """Подзапрос с числом строк model, ссылающихся на текущую запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount_counters():
+    """Пересчитать все счетчики двумя запросами UPDATE."""
+    recipes = Recipe.objects.update(
+        favorites_count=count_related(Favorite, 'recipe'),
+        in_carts_count=count_related(ShoppingList, 'recipe'),
+    )
+    users = User.objects.update(
+        recipes_count=count_related(Recipe, 'author'),
+        followers_count=count_related(Follow, 'author'),
+        following_count=count_related(Follow, 'user'),
+    )
+    return recipes, users
@@ -0,0 +1,159 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete
+)
+from django.dispatch import receiver
+
+from users.models import Follow, User
+from .autocomplete import ingredient_index
+from .caching import author_resource, bump_version, recipe_resource
+from .cart import change_cart
+from .flags import FLAG_SOURCES, clear_user_flags, invalidate_flag
+from .images import schedule_variants
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingList,
+    Tag
+)
+from .services import change_counter
+
+# Счетчики, которые меняются при создании и удалении записей:
+# модель записи -> (модель со счетчиком, внешний ключ, поле счетчика).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingList: (Recipe, 'recipe_id', 'in_carts_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+}
+
+# Поля пользователя, которые видны в рецептах как данные автора.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+# Модель записи -> название множества в кэше отметок пользователя.
+FLAG_NAMES = {model: name for name, (model, _) in FLAG_SOURCES.items()}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def refresh_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+    # Повторно после коммита: список мог перечитаться внутри транзакции.
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(**kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipes_version(instance, **kwargs):
+    bump_version('recipes', recipe_resource(instance.pk))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def bump_recipes_version_on_ingredients(instance, **kwargs):
+    bump_version('recipes', recipe_resource(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_version_on_tags(action, instance, reverse, pk_set,
+                                 **kwargs):
+    if not action.startswith('post_'):
+        return
+    # Со стороны тега в pk_set id рецептов, при очистке его нет.
+    recipe_ids = (pk_set or ()) if reverse else [instance.pk]
+    bump_version('recipes', *map(recipe_resource, recipe_ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_users_version(instance, created=False, update_fields=None,
+                       **kwargs):
+    # У нового пользователя еще нет рецептов; вход и смена пароля
+    # не меняют данные автора.
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    resources = [author_resource(instance.pk)]
+    # От общей версии зависят списки рецептов: только если он автор.
+    if Recipe.objects.filter(author_id=instance.pk).exists():
+        resources.append('users')
+    bump_version(*resources)
+
+
+def count_relation(sender, instance, delta):
+    model, attname, field = COUNTERS[sender]
+    change_counter(
+        model.objects.filter(pk=getattr(instance, attname)), field, delta
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Recipe)
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        count_relation(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Recipe)
+def count_deleted(sender, instance, **kwargs):
+    count_relation(sender, instance, -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_cart_items(instance, created, **kwargs):
+    if created:
+        change_cart(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def remove_from_cart_items(instance, **kwargs):
+    # До удаления: при удалении рецепта его ингредиенты удаляются
+    # каскадом в том же вызове, и после него вычитать было бы нечего.
+    change_cart(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def prepare_image_variants(instance, update_fields=None, **kwargs):
+    if instance.image and (update_fields is None or 'image' in update_fields):
+        schedule_variants(instance.image.name, instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+def flag_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_flag(instance.user_id, FLAG_NAMES[sender])
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Follow)
+def flag_deleted(sender, instance, **kwargs):
+    invalidate_flag(instance.user_id, FLAG_NAMES[sender])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_user_flags(instance, created=True, **kwargs):
+    # Новый пользователь может получить id удаленного.
+    if created:
+        clear_user_flags(instance.id)
@@ -0,0 +1,39 @@
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_HASH_NAME = re.compile(r'^[0-9a-f]{64}(_\w+)?\.\w+$')
+
+
+def is_content_hashed(name):
+    return bool(CONTENT_HASH_NAME.match(os.path.basename(name)))
+
+
+def same_content(stored, uploaded):
+    """Загруженный файл совпадает с сохраненным по хешу в имени.
+
+    Сохраненный файл лежит в каталоге upload_to, загруженный еще
+    без него, поэтому сравниваются только имена файлов.
+    """
+    return bool(stored) and is_content_hashed(uploaded.name) and (
+        os.path.basename(stored.name) == uploaded.name
+    )
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Файлы с хешем содержимого в имени сохраняются один раз.
+
+    Повторная загрузка того же изображения возвращает уже сохраненный
+    файл вместо копии с новым суффиксом.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if is_content_hashed(name) and self.exists(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if is_content_hashed(name) and self.exists(name):
+            return name
+        return super()._save(name, content)
@@ -1,71 +1,181 @@
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.permissions import (
+    SAFE_METHODS,
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .filters import RecipeFilter
+from .autocomplete import ingredient_index
+from .batch import add_many, add_one, remove_many, remove_one
+from .caching import (
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    author_resource,
+    recipe_resource,
+    response_cache_stats
+)
+from .filters import (
+    IngredientSearchFilter,
+    RecipeFilter,
+    RecipeSearchFilter
+)
+from .flags import get_user_flags
 from .models import (
-    Favorite,
     Ingredient,
-    IngredientAmount,
     Recipe,
-    ShoppingList,
+    ShoppingCartItem,
     Tag
 )
+from .pagination import FeedPagination
 from .permissions import IsAuthorOrAdministratorOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
 from .serializers import (
+    BatchIdsSerializer,
     FavoriteShoppingReturnSerializer,
-    FavoriteWriteSerializer,
     IngredientSerializer,
+    RecipeByIngredientsSerializer,
+    RecipeCoverageSerializer,
     RecipeFullSerializer,
     RecipeSafeSerializer,
-    ShoppingListWriteSerializer,
+    ShoppingCartItemSerializer,
     TagSerializer
 )
-from .services import get_ingredient_for_shopping
+from .services import SHOPPING_CHUNK_SIZE, SHOPPING_LIST_EXPORTERS
+
+
+ALREADY_ADDED = 'Уже добавлен!'
+
+
+def batch_response(request, name):
+    """POST добавляет, DELETE удаляет записи для {"ids": [...]}."""
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    change = add_many if request.method == 'POST' else remove_many
+    statuses = change(request.user, name, ids)
+    return Response({
+        'results': [{'id': pk, 'status': statuses[pk]} for pk in ids]
+    })
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Получить ингредиенты."""
 
+    conditional_resources = ('ingredients',)
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny, ]
     queryset = Ingredient.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, IngredientSearchFilter]
     # Поиск по частичному вхождению в начале названия ингредиента.
     search_fields = ('^name',)
     pagination_class = None
 
+    def filter_queryset(self, queryset):
+        if (
+            not settings.INGREDIENT_AUTOCOMPLETE
+            or self.action != 'list'
+            or IngredientSearchFilter.is_fuzzy(self.request.query_params)
+        ):
+            return super().filter_queryset(queryset)
+        return ingredient_index.search(
+            self.request.query_params.get(api_settings.SEARCH_PARAM, '')
+        )
+
 
-class TagView(viewsets.ReadOnlyModelViewSet):
+class TagView(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Получить теги."""
 
+    conditional_resources = ('tags',)
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet
+):
     """Работа с рецептами."""
 
+    conditional_resources = ('recipes', 'tags', 'ingredients', 'users')
     permission_classes = [IsAuthorOrAdministratorOrReadOnly, ]
     queryset = Recipe.objects.all()
 
-    filter_backends = [DjangoFilterBackend, ]
+    filter_backends = [DjangoFilterBackend, RecipeSearchFilter]
     filterset_class = RecipeFilter
 
-    pagination_class = PageNumberPagination
+    pagination_class = FeedPagination
+    cursor_ordering = ('-pub_date', '-id')
+
+    def use_conditional_get(self, request):
+        # Отметки избранного и покупок зависят от пользователя.
+        return request.user.is_anonymous
+
+    def response_resources(self, request, *args, **kwargs):
+        if self.action != 'retrieve':
+            return super().response_resources(request, *args, **kwargs)
+        # Карточка зависит от своего рецепта и его автора, а не от
+        # всех рецептов и пользователей; запрос только при промахе.
+        resources = [recipe_resource(kwargs['pk']), 'tags', 'ingredients']
+        author_id = Recipe.objects.filter(pk=kwargs['pk']).values_list(
+            'author_id', flat=True
+        ).first()
+        if author_id is not None:
+            resources.append(author_resource(author_id))
+        return resources
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read()
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSafeSerializer
         return RecipeFullSerializer
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[AllowAny],
+        url_path='by_ingredients',
+    )
+    def by_ingredients(self, request):
+        """Рецепты из имеющихся ингредиентов ?ingredients=1&ingredients=2."""
+        params = RecipeByIngredientsSerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            'max_missing': request.query_params.get('max_missing'),
+        })
+        params.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(self.get_queryset()).by_ingredients(
+            **params.validated_data
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeCoverageSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAdminUser],
+        url_path='cache_stats',
+    )
+    def cache_stats(self, request):
+        """Попадания и промахи кэша ответов для анонимных пользователей."""
+        return Response(response_cache_stats())
+
     @action(
         detail=False,
         methods=['post', 'delete'],
@@ -75,25 +185,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, recipe_id):
         if request.method == 'POST':
             recipe = get_object_or_404(Recipe, id=recipe_id)
-            serializer = FavoriteWriteSerializer(
-                data={'recipe': recipe_id, 'user': request.user.id},
-                context={'request': request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-
+            if not add_one(request.user, 'favorites', recipe.id):
+                return Response(
+                    {'errors': ALREADY_ADDED},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             serializer = FavoriteShoppingReturnSerializer()
             return Response(
                 serializer.to_representation(instance=recipe),
                 status=status.HTTP_201_CREATED
             )
-        user = request.user
-        favorite = get_object_or_404(
-            Favorite, user=user, recipe__id=recipe_id
-        )
-        favorite.delete()
+        if not remove_one(request.user, 'favorites', int(recipe_id)):
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/batch',
+    )
+    def favorite_batch(self, request):
+        return batch_response(request, 'favorites')
+
     @action(
         detail=False,
         methods=['post', 'delete'],
@@ -103,42 +217,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping(self, request, recipe_id):
         if request.method == 'POST':
             recipe = get_object_or_404(Recipe, id=recipe_id)
-            serializer = ShoppingListWriteSerializer(
-                data={'recipe': recipe_id, 'user': request.user.id},
-                context={'request': request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-
+            if not add_one(request.user, 'cart', recipe.id):
+                return Response(
+                    {'errors': ALREADY_ADDED},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             serializer = FavoriteShoppingReturnSerializer()
             return Response(
                 serializer.to_representation(instance=recipe),
                 status=status.HTTP_201_CREATED
             )
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        ShoppingList.objects.filter(user=user, recipe=recipe).delete()
+        if not remove_one(request.user, 'cart', int(recipe_id)):
+            get_object_or_404(Recipe, id=recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/batch',
+    )
+    def shopping_batch(self, request):
+        return batch_response(request, 'cart')
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+    )
+    def shopping_cart_summary(self, request):
+        """Сводка списка покупок: число рецептов и суммы ингредиентов."""
+        items = ShoppingCartItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        )
+        return Response({
+            'recipes_count': len(get_user_flags(request.user)['cart']),
+            'ingredients': ShoppingCartItemSerializer(items, many=True).data,
+        })
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated],
         url_path=r'download_shopping_cart',
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def get_download_shopping_cart(self, request):
-        ingredient_and_amount = IngredientAmount.objects.filter(
-            recipe__purchases__user=request.user
+        # Формат выбирается по ?format= или заголовку Accept.
+        export_format = request.accepted_renderer.format
+        # Суммы уже посчитаны, см. recipes.cart.
+        ingredient_and_amount = ShoppingCartItem.objects.filter(
+            user=request.user
         ).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            ingredient_amount=Sum('amount')
-        )
-
-        resulted_list = get_ingredient_for_shopping(ingredient_and_amount)
+            'ingredient__measurement_unit',
+            ingredient_amount=F('amount')
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
 
-        return HttpResponse(
-            resulted_list,
-            'Content-Type: text/plain'
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_EXPORTERS[export_format](
+                ingredient_and_amount.iterator(
+                    chunk_size=SHOPPING_CHUNK_SIZE
+                )
+            ),
+            content_type=(
+                f'{request.accepted_renderer.media_type}; charset=utf-8'
+            ),
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{export_format}"'
         )
+        return response
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Шаг релиза: запускается один раз перед стартом backend.
+set -e
+attempt=0
+until python manage.py migrate --noinput; do
+    attempt=$((attempt + 1))
+    if [ "$attempt" -ge 10 ]; then
+        echo "База недоступна, миграции не применены" >&2
+        exit 1
+    fi
+    sleep 3
+done
+python manage.py collectstatic --noinput
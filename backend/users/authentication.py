@@ -0,0 +1,103 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Токен -> (пользователь, токен) в памяти процесса и в общем кэше.
+
+    Локальный кэш ограничен по размеру (вытесняются давно не читанные
+    записи) и по времени жизни записи. Общий кэш из CACHES подключается
+    настройкой TOKEN_CACHE_SHARED и переживает перезапуск процессов.
+    Удаление записи сбрасывает ее в этом процессе и в общем кэше,
+    в остальных процессах запись живет не дольше TOKEN_CACHE_TTL
+    (0 — только общий кэш).
+    """
+
+    prefix = 'auth-token:'
+
+    def __init__(self, maxsize, ttl, shared=None, shared_ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            # Записи нет или она устарела.
+            self._entries.pop(key, None)
+        if self.shared is None:
+            return None
+        value = caches[self.shared].get(self.prefix + key)
+        if value is None:
+            return None
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.shared is not None:
+            caches[self.shared].set(
+                self.prefix + key, value, self.shared_ttl
+            )
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None and keys:
+            caches[self.shared].delete_many(
+                [self.prefix + key for key in keys]
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE,
+    settings.TOKEN_CACHE_TTL,
+    settings.TOKEN_CACHE_SHARED,
+    settings.TOKEN_CACHE_SHARED_TTL,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса Token JOIN User на каждый вызов.
+
+    Записи сбрасываются сигналами users.signals при удалении токена
+    (выход через djoser) и при сохранении пользователя: смене пароля,
+    деактивации, правке профиля.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # Каждый запрос получает свою копию: представления меняют
+        # request.user, а запись в кэше общая для потоков. Копия может
+        # быть устаревшей, сохранять ее можно только с update_fields.
+        return copy.copy(user), token
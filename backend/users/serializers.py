@@ -2,6 +2,8 @@ from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from recipes.flags import context_flags
+from recipes.images import variant_url
 from recipes.models import Recipe
 from .models import Follow, User
 
@@ -51,7 +53,7 @@ class RecipeImagePathSerializer(serializers.ModelSerializer):
 
     def get_image(self, obj):
         request = self.context.get('request')
-        image_url = obj.image.url
+        image_url = variant_url(obj.image, 'list')
         return request.build_absolute_uri(image_url)
 
 
@@ -80,15 +82,14 @@ class FollowSubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, user):
-        current_user = self.context['request'].user
-        return (
-            current_user.is_authenticated
-            and Follow.objects.filter(user=current_user, author=user).exists()
-        )
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
+        return user.id in context_flags(self.context)['follows']
 
     def get_recipes(self, user):
         request = self.context.get('request')
         recipes_limit = request.query_params.get('recipes_limit')
+        # При prefetch срез берется из уже загруженного списка.
         recipes = user.recipes.all()
         if recipes_limit:
             recipes = recipes[:int(recipes_limit)]
@@ -99,7 +100,15 @@ class FollowSubscriptionSerializer(serializers.ModelSerializer):
         ).data
 
     def get_recipes_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
+
+
+class SubscriptionsParamsSerializer(serializers.Serializer):
+    """Параметры ленты подписок."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=0, required=False, allow_null=True
+    )
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -120,23 +129,19 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, user):
-        current_user = self.context['request'].user
-        return (
-            current_user.is_authenticated
-            and Follow.objects.filter(user=current_user, author=user).exists()
-        )
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
+        return user.id in context_flags(self.context)['follows']
 
     def create(self, validated_data):
         """Регистрация пользователя через форму."""
-        user = User.objects.create(
+        return User.objects.create(
             email=validated_data['email'],
             username=validated_data['username'],
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
             password=make_password(validated_data['password'])
         )
-        user.save()
-        return user
 
 
 class PasswordSerializer(serializers.ModelSerializer):
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.services import change_counter
+from .authentication import token_cache
+from .models import Follow, User
+
+
+def count_follow(follow, delta):
+    change_counter(
+        User.objects.filter(pk=follow.author_id), 'followers_count', delta
+    )
+    change_counter(
+        User.objects.filter(pk=follow.user_id), 'following_count', delta
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_follow_created(instance, created, **kwargs):
+    if created:
+        count_follow(instance, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_follow_deleted(instance, **kwargs):
+    count_follow(instance, -1)
+
+
+def forget_tokens(*keys):
+    # Повтор после коммита убирает запись, которую запрос, прочитавший
+    # токен до коммита, успел положить в общий кэш.
+    token_cache.delete(*keys)
+    transaction.on_commit(lambda: token_cache.delete(*keys))
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    forget_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, created, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, остальные изменения (пароль,
+    # is_active, профиль) должны попасть в request.user сразу.
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    forget_tokens(*Token.objects.filter(
+        user_id=instance.pk
+    ).values_list('key', flat=True))
@@ -1,14 +1,20 @@
 from django.contrib.auth.hashers import check_password
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from recipes.batch import remove_one
+from recipes.models import Recipe
+from recipes.pagination import FeedPagination
+from recipes.views import batch_response
 from .models import Follow, User
 from .serializers import (
     FollowSubscriptionSerializer,
     PasswordSerializer,
+    SubscriptionsParamsSerializer,
     UserFollowSerializer,
     UserSerializer
 )
@@ -18,6 +24,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny, ]
+    pagination_class = FeedPagination
+    cursor_ordering = ('id',)
 
     @action(
         detail=False,
@@ -42,7 +50,9 @@ class UserViewSet(viewsets.ModelViewSet):
         current_password = serializer.data['current_password']
         if check_password(current_password, user.password):
             user.set_password(new_password)
-            user.save()
+            # request.user — копия из кэша токенов: полный save()
+            # записал бы устаревшие счетчики и is_active.
+            user.save(update_fields=['password'])
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(
             {'auth_token': 'Wrong password!'},
@@ -64,10 +74,37 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        author = get_object_or_404(User, id=following_id)
-        Follow.objects.filter(user=request.user, author=author).delete()
+        if not remove_one(request.user, 'follows', int(following_id)):
+            get_object_or_404(User, id=following_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe/batch',
+    )
+    def subscribe_batch(self, request):
+        return batch_response(request, 'follows')
+
+    def get_latest_recipes(self):
+        """Последние recipes_limit рецептов каждого автора одним запросом."""
+        recipes = Recipe.objects.all()
+        params = SubscriptionsParamsSerializer(data={
+            'recipes_limit': (
+                self.request.query_params.get('recipes_limit') or None
+            ),
+        })
+        params.is_valid(raise_exception=True)
+        recipes_limit = params.validated_data['recipes_limit']
+        if recipes_limit is None:
+            return recipes
+        # Подзапрос идет по индексу (author, -pub_date, -id).
+        latest = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-pub_date', '-id').values('id')[:recipes_limit]
+        return recipes.filter(id__in=Subquery(latest))
+
     @action(
         detail=False,
         methods=['get'],
@@ -76,7 +113,15 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        following_users = User.objects.filter(following__user=user)
+        following_users = User.objects.filter(
+            following__user=user
+        ).annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(author=OuterRef('pk'), user=user)
+            ),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=self.get_latest_recipes())
+        )
         page = self.paginate_queryset(following_users)
 
         serializer = FollowSubscriptionSerializer(
@@ -0,0 +1,435 @@
+"""Количество запросов и время ответа всех эндпоинтов API.
+
+Запуск из папки backend:
+    python manage.py test ../tests -p "bench_api.py"
+
+Размер данных задается переменными окружения (значения по умолчанию
+в SEED), число повторов каждого запроса — BENCH_REPEAT. Отчет в JSON
+пишется в файл BENCH_REPORT. Тест падает, если эндпоинт делает больше
+запросов к базе, чем указано в его бюджете.
+"""
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from PIL import Image
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingList,
+    Tag
+)
+from recipes.cart import rebuild_carts
+from recipes.services import recount_counters
+from users.models import Follow, User
+
+SEED = {
+    'users': int(os.getenv('BENCH_USERS', 30)),
+    'recipes': int(os.getenv('BENCH_RECIPES', 300)),
+    'ingredients': int(os.getenv('BENCH_INGREDIENTS', 500)),
+    'ingredients_per_recipe': int(os.getenv('BENCH_INGREDIENTS_PER_RECIPE', 8)),
+    'favorites': int(os.getenv('BENCH_FAVORITES', 20)),
+    'carts': int(os.getenv('BENCH_CARTS', 10)),
+    'follows': int(os.getenv('BENCH_FOLLOWS', 10)),
+}
+REPEAT = int(os.getenv('BENCH_REPEAT', 20))
+REPORT = os.getenv('BENCH_REPORT', 'bench_api.json')
+# Рецептов в одном пакетном запросе.
+BATCH_SIZE = 20
+PASSWORD = 'bench-password-123'
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+IMAGE = make_image()
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    url: Callable[['APIBenchmark'], str]
+    budget: int
+    data: Optional[Callable[['APIBenchmark'], dict]] = None
+    anonymous: bool = False
+    # Подготовка и откат состояния вне замера, чтобы повторы были
+    # одинаковыми (например, удалить добавленное в избранное).
+    prepare: Optional[Callable[['APIBenchmark'], None]] = None
+    cleanup: Optional[Callable[['APIBenchmark'], None]] = None
+    # Токен для запроса, по умолчанию токен основного пользователя.
+    token: Optional[Callable[['APIBenchmark'], str]] = None
+    timings: list = field(default_factory=list)
+
+
+# Бюджеты учитывают запрос TokenAuthentication для авторизованных клиентов.
+
+
+def recipe_payload(bench):
+    return {
+        'ingredients': [
+            {'id': ingredient, 'amount': 10}
+            for ingredient in bench.ingredient_ids[:5]
+        ],
+        'tags': bench.tag_ids[:2],
+        'image': IMAGE,
+        'name': 'Рецепт для замера',
+        'text': 'Описание',
+        'cooking_time': 15,
+    }
+
+
+def delete_created_recipes(bench):
+    Recipe.objects.filter(name='Рецепт для замера').delete()
+
+
+def create_temp_recipe(bench):
+    bench.temp_recipe = Recipe.objects.create(
+        author=bench.user, name='Временный рецепт', text='-',
+        image='images/temp.png'
+    ).id
+
+
+def clear_batch_cart(bench):
+    ShoppingList.objects.filter(
+        user=bench.user, recipe_id__in=bench.recipe_ids[-BATCH_SIZE:]
+    ).delete()
+
+
+def fill_batch_cart(bench):
+    clear_batch_cart(bench)
+    for recipe in bench.recipe_ids[-BATCH_SIZE:]:
+        ShoppingList.objects.create(user=bench.user, recipe_id=recipe)
+
+
+def create_temp_token(bench):
+    Token.objects.filter(user=bench.author).delete()
+    return Token.objects.create(user=bench.author).key
+
+
+ENDPOINTS = [
+    Endpoint('tags list', 'get', lambda b: '/api/tags/', 2),
+    Endpoint('tag detail', 'get', lambda b: f'/api/tags/{b.tag_ids[0]}/', 2),
+    Endpoint('ingredients list', 'get', lambda b: '/api/ingredients/', 1),
+    Endpoint(
+        'ingredients search', 'get',
+        lambda b: '/api/ingredients/?name=ингр', 1
+    ),
+    Endpoint(
+        'ingredient detail', 'get',
+        lambda b: f'/api/ingredients/{b.ingredient_ids[0]}/', 2
+    ),
+    Endpoint('recipes list', 'get', lambda b: '/api/recipes/', 5),
+    Endpoint(
+        'recipes list anonymous', 'get', lambda b: '/api/recipes/', 4,
+        anonymous=True
+    ),
+    Endpoint(
+        'recipes by tags', 'get',
+        lambda b: '/api/recipes/?tags=tag0&tags=tag1', 6
+    ),
+    Endpoint(
+        'recipes favorited', 'get', lambda b: '/api/recipes/?is_favorited=1', 5
+    ),
+    Endpoint(
+        'recipes in cart', 'get',
+        lambda b: '/api/recipes/?is_in_shopping_cart=1', 5
+    ),
+    Endpoint(
+        'recipes cursor page', 'get', lambda b: '/api/recipes/?cursor=', 4
+    ),
+    Endpoint(
+        'recipes search', 'get', lambda b: '/api/recipes/?search=рецепт', 5
+    ),
+    Endpoint(
+        'recipes by ingredients', 'get',
+        lambda b: '/api/recipes/by_ingredients/?' + '&'.join(
+            f'ingredients={ingredient}'
+            for ingredient in b.ingredient_ids[:20]
+        ), 5
+    ),
+    Endpoint(
+        'recipe detail', 'get', lambda b: f'/api/recipes/{b.recipe_ids[0]}/', 4
+    ),
+    Endpoint(
+        'recipe create', 'post', lambda b: '/api/recipes/', 30,
+        data=recipe_payload, cleanup=delete_created_recipes
+    ),
+    Endpoint(
+        'recipe update', 'patch', lambda b: f'/api/recipes/{b.own_recipe}/',
+        30, data=recipe_payload
+    ),
+    Endpoint(
+        'favorite add', 'post',
+        lambda b: f'/api/recipes/{b.free_recipe}/favorite/', 8,
+        cleanup=lambda b: Favorite.objects.filter(
+            user=b.user, recipe_id=b.free_recipe
+        ).delete()
+    ),
+    Endpoint(
+        'cart add', 'post',
+        lambda b: f'/api/recipes/{b.free_recipe}/shopping_cart/', 8,
+        cleanup=lambda b: ShoppingList.objects.filter(
+            user=b.user, recipe_id=b.free_recipe
+        ).delete()
+    ),
+    Endpoint(
+        'cart add batch', 'post',
+        lambda b: '/api/recipes/shopping_cart/batch/', 8,
+        data=lambda b: {'ids': b.recipe_ids[-BATCH_SIZE:]},
+        prepare=clear_batch_cart, cleanup=clear_batch_cart
+    ),
+    Endpoint(
+        'recipe delete', 'delete',
+        lambda b: f'/api/recipes/{b.temp_recipe}/', 10,
+        prepare=create_temp_recipe
+    ),
+    Endpoint(
+        'favorite remove', 'delete',
+        lambda b: f'/api/recipes/{b.free_recipe}/favorite/', 5,
+        prepare=lambda b: Favorite.objects.get_or_create(
+            user=b.user, recipe_id=b.free_recipe
+        )
+    ),
+    Endpoint(
+        'cart remove', 'delete',
+        lambda b: f'/api/recipes/{b.free_recipe}/shopping_cart/', 6,
+        prepare=lambda b: ShoppingList.objects.get_or_create(
+            user=b.user, recipe_id=b.free_recipe
+        )
+    ),
+    Endpoint(
+        'cart remove batch', 'delete',
+        lambda b: '/api/recipes/shopping_cart/batch/', 8,
+        data=lambda b: {'ids': b.recipe_ids[-BATCH_SIZE:]},
+        prepare=fill_batch_cart, cleanup=clear_batch_cart
+    ),
+    Endpoint(
+        'download shopping cart', 'get',
+        lambda b: '/api/recipes/download_shopping_cart/', 2
+    ),
+    Endpoint(
+        'shopping cart summary', 'get',
+        lambda b: '/api/recipes/shopping_cart/', 2
+    ),
+    Endpoint('users list', 'get', lambda b: '/api/users/', 3),
+    Endpoint('user detail', 'get', lambda b: f'/api/users/{b.author.id}/', 2),
+    Endpoint('me', 'get', lambda b: '/api/users/me/', 2),
+    Endpoint(
+        'subscribe', 'post',
+        lambda b: f'/api/users/{b.free_author.id}/subscribe/', 10,
+        cleanup=lambda b: Follow.objects.filter(
+            user=b.user, author=b.free_author
+        ).delete()
+    ),
+    Endpoint(
+        'unsubscribe', 'delete',
+        lambda b: f'/api/users/{b.free_author.id}/subscribe/', 7,
+        prepare=lambda b: Follow.objects.get_or_create(
+            user=b.user, author=b.free_author
+        )
+    ),
+    Endpoint(
+        'user register', 'post', lambda b: '/api/users/', 5,
+        data=lambda b: {
+            'email': 'new@example.com', 'username': 'new_user',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': PASSWORD,
+        },
+        anonymous=True,
+        cleanup=lambda b: User.objects.filter(username='new_user').delete()
+    ),
+    Endpoint(
+        'subscriptions', 'get',
+        lambda b: '/api/users/subscriptions/?recipes_limit=3', 4
+    ),
+    Endpoint(
+        'set password', 'post', lambda b: '/api/users/set_password/', 3,
+        data=lambda b: {
+            'new_password': PASSWORD, 'current_password': PASSWORD
+        }
+    ),
+    Endpoint(
+        'token login', 'post', lambda b: '/api/auth/token/login/', 4,
+        data=lambda b: {'email': b.user.email, 'password': PASSWORD},
+        anonymous=True
+    ),
+    Endpoint(
+        'token logout', 'post', lambda b: '/api/auth/token/logout/', 3,
+        token=create_temp_token
+    ),
+]
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+class APIBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        users = [
+            User(
+                username=f'user{i}', email=f'user{i}@example.com',
+                first_name='Имя', last_name='Фамилия',
+            )
+            for i in range(SEED['users'])
+        ]
+        for user in users:
+            user.set_password(PASSWORD)
+        User.objects.bulk_create(users)
+        users = list(User.objects.all())
+        cls.user, cls.author, cls.free_author = users[:3]
+
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', slug=f'tag{i}', color=f'#0000{i:02d}')
+            for i in range(5)
+        ])
+        cls.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(SEED['ingredients'])
+        ])
+        cls.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=rng.choice(users[1:]), name=f'Рецепт {i}', text='-',
+                image='images/temp.png', cooking_time=10,
+            )
+            for i in range(SEED['recipes'])
+        ])
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(cls.tag_ids, 2)
+        ])
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(
+                cls.ingredient_ids, SEED['ingredients_per_recipe']
+            )
+        ], batch_size=5000)
+        for model, per_user in (
+            (Favorite, SEED['favorites']),
+            (ShoppingList, SEED['carts']),
+        ):
+            model.objects.bulk_create([
+                model(user=user, recipe_id=recipe)
+                for user in users
+                for recipe in rng.sample(recipes[1:], per_user)
+            ])
+        Follow.objects.bulk_create([
+            Follow(user=user, author=author)
+            for user in users
+            for author in rng.sample(users[3:], SEED['follows'])
+            if author != user
+        ])
+        recount_counters()
+        rebuild_carts()
+        cls.recipe_ids = recipes
+        cls.free_recipe = recipes[0]
+        cls.own_recipe = Recipe.objects.create(
+            author=cls.user, name='Свой рецепт', text='-',
+            image='images/temp.png'
+        ).id
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+
+    def client_for(self, endpoint):
+        client = APIClient()
+        if endpoint.anonymous:
+            return client
+        token = endpoint.token(self) if endpoint.token else self.token.key
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return client
+
+    def run_endpoint(self, endpoint):
+        queries = size = None
+        for _ in range(REPEAT):
+            if endpoint.prepare:
+                endpoint.prepare(self)
+            request = getattr(self.client_for(endpoint), endpoint.method)
+            url = endpoint.url(self)
+            data = endpoint.data(self) if endpoint.data else None
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request(url, data, format='json')
+                content = (
+                    b''.join(response.streaming_content)
+                    if response.streaming else response.content
+                )
+                endpoint.timings.append(time.perf_counter() - started)
+            self.assertLess(
+                response.status_code, 400, f'{endpoint.name}: {content[:200]}'
+            )
+            queries = len(context.captured_queries)
+            size = len(content)
+            if endpoint.cleanup:
+                endpoint.cleanup(self)
+        return {
+            'method': endpoint.method.upper(),
+            'url': url,
+            'queries': queries,
+            'budget': endpoint.budget,
+            'p50_ms': round(percentile(endpoint.timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(endpoint.timings, 95) * 1000, 2),
+            'bytes': size,
+        }
+
+    def test_endpoints(self):
+        report = {'seed': SEED, 'repeat': REPEAT, 'endpoints': {}}
+        over_budget = []
+        for endpoint in ENDPOINTS:
+            result = self.run_endpoint(endpoint)
+            report['endpoints'][endpoint.name] = result
+            if result['queries'] > endpoint.budget:
+                over_budget.append(
+                    f'{endpoint.name}: {result["queries"]} запросов '
+                    f'при бюджете {endpoint.budget}'
+                )
+        with open(REPORT, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        print(f'\n{"эндпоинт":<26}{"запросов":>9}{"p50 мс":>9}'
+              f'{"p95 мс":>9}{"байт":>9}')
+        for name, result in report['endpoints'].items():
+            print(
+                f'{name:<26}{result["queries"]:>9}{result["p50_ms"]:>9}'
+                f'{result["p95_ms"]:>9}{result["bytes"]:>9}'
+            )
+        self.assertFalse(over_budget, '\n'.join(over_budget))
@@ -0,0 +1,113 @@
+"""Цена открытия соединения с базой: CONN_MAX_AGE=0 против постоянного.
+
+Запуск из папки backend против настроенной базы (нагляднее всего
+с PostgreSQL по сети, например из контейнера backend):
+    python ../tests/bench_connections.py
+
+Скрипт имитирует BENCH_REQUESTS запросов Django: сигналы начала
+и конца запроса и один SELECT между ними, сначала с закрытием
+соединения после каждого запроса, затем с постоянным соединением:
+с проверкой SELECT 1 в каждом запросе и, как в профиле prod, только
+после простоя дольше DB_HEALTH_CHECK_IDLE секунд.
+
+Если задан BENCH_URL, дополнительно выполняется нагрузка на уже
+запущенный сервер из BENCH_THREADS потоков; ее стоит сравнить между
+запусками сервера с DJANGO_PROFILE=dev и DJANGO_PROFILE=prod.
+"""
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.signals import request_finished, request_started  # noqa
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from foodgram.db import connect_health_checks  # noqa: E402
+
+REQUESTS = int(os.getenv('BENCH_REQUESTS', 500))
+URL = os.getenv('BENCH_URL')
+THREADS = int(os.getenv('BENCH_THREADS', 8))
+
+
+def simulate(max_age, health_checks, idle):
+    connection.close()
+    settings.DB_HEALTH_CHECK_IDLE = idle
+    connection.settings_dict['CONN_MAX_AGE'] = max_age
+    connection.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+    opened = []
+
+    def count_opened(**kwargs):
+        opened.append(kwargs['connection'])
+
+    connection_created.connect(count_opened)
+    timings = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+        timings.append(time.perf_counter() - started)
+    connection_created.disconnect(count_opened)
+    connection.close()
+    return timings, len(opened)
+
+
+def report(name, timings, extra=''):
+    timings = sorted(timings)
+    print(
+        f'{name:>32}: p50 {statistics.median(timings) * 1000:.2f} мс, '
+        f'p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} мс, '
+        f'всего {sum(timings):.2f} с{extra}'
+    )
+
+
+def fetch(url):
+    started = time.perf_counter()
+    with urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def main():
+    connect_health_checks()
+    print(
+        f'{connection.vendor}, {REQUESTS} запросов '
+        f'({connection.settings_dict["HOST"] or "локально"})'
+    )
+    idle = settings.DB_HEALTH_CHECK_IDLE
+    for name, max_age, health_checks, check_idle in (
+        ('CONN_MAX_AGE=0', 0, False, idle),
+        ('CONN_MAX_AGE=60', 60, False, idle),
+        ('CONN_MAX_AGE=60 + проверка', 60, True, 0),
+        ('CONN_MAX_AGE=60 + после простоя', 60, True, idle),
+    ):
+        timings, opened = simulate(max_age, health_checks, check_idle)
+        report(name, timings, f', соединений открыто: {opened}')
+
+    if URL:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as executor:
+            timings = list(executor.map(fetch, [URL] * REQUESTS))
+        elapsed = time.perf_counter() - started
+        report(
+            URL, timings, f', {REQUESTS / elapsed:.0f} запросов/с'
+        )
+
+
+if __name__ == '__main__':
+    main()
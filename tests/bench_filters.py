@@ -0,0 +1,127 @@
+"""Фильтр ленты по нескольким тегам: соединение с DISTINCT против EXISTS.
+
+Запуск из папки backend:
+    python manage.py test ../tests -p "bench_filters.py"
+
+Количество рецептов задается переменной окружения BENCH_FILTER_RECIPES
+(по умолчанию миллион), число повторов каждого запроса — BENCH_REPEAT.
+"""
+import os
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, Tag
+from users.models import User
+
+RECIPES = int(os.getenv('BENCH_FILTER_RECIPES', 1000000))
+REPEAT = int(os.getenv('BENCH_REPEAT', 5))
+TAGS = 8
+TAGS_PER_RECIPE = 3
+FAVORITE_EVERY = 100
+BATCH = 10000
+QUERIES = (
+    'tags=tag0&tags=tag1',
+    'tags=tag0&tags=tag1&tags=tag2&tags=tag3',
+    'tags=tag0&tags=tag1&is_favorited=1',
+)
+
+
+def legacy_filter(queryset, slugs, user, is_favorited):
+    """Прежний фильтр: соединения, повторы убирает DISTINCT."""
+    queryset = queryset.filter(tags__slug__in=slugs)
+    if is_favorited:
+        queryset = queryset.filter(favorites__user=user)
+    return queryset.distinct()
+
+
+def timed(function):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+class RecipeFilterBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='bench', email='bench@example.com', password='pass'
+        )
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', slug=f'tag{i}', color=f'#00000{i}')
+            for i in range(TAGS)
+        ])
+        tags = list(Tag.objects.values_list('id', flat=True))
+        through = Recipe.tags.through
+        for start in range(0, RECIPES, BATCH):
+            Recipe.objects.bulk_create([
+                Recipe(
+                    author=cls.user, name=f'Рецепт {number}', text='-',
+                    image='images/temp.png', cooking_time=1
+                )
+                for number in range(start, min(start + BATCH, RECIPES))
+            ])
+        recipes = Recipe.objects.values_list('id', flat=True).iterator()
+        rows = []
+        for number, recipe in enumerate(recipes):
+            rows += [
+                through(recipe_id=recipe, tag_id=tags[(number + shift) % TAGS])
+                for shift in range(TAGS_PER_RECIPE)
+            ]
+            if number % FAVORITE_EVERY == 0:
+                rows.append(Favorite(user=cls.user, recipe_id=recipe))
+            if len(rows) >= BATCH:
+                cls.flush(rows)
+                rows = []
+        cls.flush(rows)
+
+    @staticmethod
+    def flush(rows):
+        for model in {type(row) for row in rows}:
+            model.objects.bulk_create(
+                [row for row in rows if type(row) is model]
+            )
+
+    def test_compare_filters(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        request = SimpleNamespace(user=self.user)
+        print(f'\nРецептов: {RECIPES}, тегов у рецепта: {TAGS_PER_RECIPE}')
+        for query in QUERIES:
+            params = QueryDict(query)
+            variants = {
+                'DISTINCT': legacy_filter(
+                    Recipe.objects.all(), params.getlist('tags'), self.user,
+                    params.get('is_favorited')
+                ),
+                'EXISTS': RecipeFilter(
+                    params, Recipe.objects.all(), request=request
+                ).qs,
+            }
+            self.assertEqual(
+                variants['DISTINCT'].count(), variants['EXISTS'].count()
+            )
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(f'/api/recipes/?{query}')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any(
+                'DISTINCT' in item['sql'] for item in queries.captured_queries
+            ))
+            print(query)
+            for name, queryset in variants.items():
+                page = timed(lambda: list(queryset[:6]))
+                count = timed(queryset.count)
+                print(
+                    f'{name:>12}: страница {page:.1f} мс, '
+                    f'COUNT {count:.1f} мс'
+                )
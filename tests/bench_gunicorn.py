@@ -0,0 +1,123 @@
+"""Пропускная способность ленты рецептов при разных моделях воркеров.
+
+Запуск из папки backend против настроенной и заполненной базы:
+    python ../tests/bench_gunicorn.py
+
+Для каждой модели из MODELS поднимается gunicorn с gunicorn.conf.py
+на свободном порту, и BENCH_CONCURRENCY потоков выполняют
+BENCH_REQUESTS запросов к BENCH_PATH. Модели gevent и ASGI
+пропускаются, если не установлен gevent или uvicorn. ASGI запускается
+с асинхронными представлениями (ASYNC_READ_VIEWS=True), для сравнения
+стоит взять BENCH_PATH=/api/recipes/<id>/ или /api/tags/. Число
+воркеров — BENCH_WORKERS (по умолчанию как в gunicorn.conf.py).
+"""
+import importlib.util
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.request import urlopen
+
+BACKEND = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'backend'
+)
+REQUESTS = int(os.getenv('BENCH_REQUESTS', 1000))
+CONCURRENCY = int(os.getenv('BENCH_CONCURRENCY', 32))
+PATH = os.getenv('BENCH_PATH', '/api/recipes/')
+WORKERS = int(os.getenv('BENCH_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+MODELS = (
+    ('sync, 1 воркер', {'GUNICORN_WORKER_CLASS': 'sync',
+                        'GUNICORN_WORKERS': '1'}),
+    ('sync', {'GUNICORN_WORKER_CLASS': 'sync'}),
+    ('gthread', {'GUNICORN_WORKER_CLASS': 'gthread'}),
+    ('gevent', {'GUNICORN_WORKER_CLASS': 'gevent'}),
+    ('asgi, uvicorn', {
+        'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker',
+        'GUNICORN_APP': 'foodgram.asgi:application',
+        'ASYNC_READ_VIEWS': 'True',
+    }),
+)
+# Модуль, без которого модель воркеров не запустится.
+REQUIRES = {'gevent': 'gevent', 'uvicorn.workers.UvicornWorker': 'uvicorn'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn завершился при запуске')
+        try:
+            with urlopen(url) as response:
+                response.read()
+            return
+        except (URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} не ответил за {timeout} с')
+
+
+def fetch(url):
+    started = time.perf_counter()
+    with urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def run(name, env):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{PATH}'
+    env = {
+        **os.environ,
+        'GUNICORN_WORKERS': str(WORKERS),
+        **env,
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_ACCESSLOG': '',
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn',
+         env.get('GUNICORN_APP', 'foodgram.wsgi:application'),
+         '-c', 'gunicorn.conf.py'],
+        cwd=BACKEND, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(url, process)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENCY) as executor:
+            timings = sorted(executor.map(fetch, [url] * REQUESTS))
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    print(
+        f'{name:>16}: {REQUESTS / elapsed:7.1f} запросов/с, '
+        f'p50 {statistics.median(timings) * 1000:.1f} мс, '
+        f'p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} мс'
+    )
+
+
+def main():
+    print(
+        f'{PATH}: {REQUESTS} запросов, {CONCURRENCY} одновременно, '
+        f'воркеров {WORKERS}'
+    )
+    for name, env in MODELS:
+        module = REQUIRES.get(env['GUNICORN_WORKER_CLASS'])
+        if module and importlib.util.find_spec(module) is None:
+            print(f'{name:>16}: {module} не установлен')
+            continue
+        run(name, env)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Сравнение выгрузки списка покупок: HttpResponse против потоковой.
+
+Запуск из папки backend:
+    python manage.py test ../tests -p "bench_shopping_cart.py"
+
+Размер корзины задается переменными окружения BENCH_CART_RECIPES
+и BENCH_CART_INGREDIENTS.
+"""
+import os
+import time
+import tracemalloc
+
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.cart import rebuild_carts
+from recipes.models import (
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingList
+)
+from recipes.services import iter_shopping_txt
+from users.models import User
+
+RECIPES = int(os.getenv('BENCH_CART_RECIPES', 2000))
+INGREDIENTS = int(os.getenv('BENCH_CART_INGREDIENTS', 2000))
+INGREDIENTS_PER_RECIPE = 10
+
+
+def get_ingredient_for_shopping(ingredient_and_amount):
+    """Прежнее составление списка покупок целиком в памяти."""
+    return list(iter_shopping_txt(ingredient_and_amount))
+
+
+def legacy_download(user):
+    """Прежняя реализация: весь список собирается в памяти."""
+    ingredient_and_amount = IngredientAmount.objects.filter(
+        recipe__purchases__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        ingredient_amount=Sum('amount')
+    )
+    resulted_list = get_ingredient_for_shopping(ingredient_and_amount)
+    return HttpResponse(resulted_list, 'Content-Type: text/plain')
+
+
+def export_lines(content):
+    return sorted(
+        line.split(') ', 1)[1] for line in content.decode().splitlines()
+    )
+
+
+def measure(get_first_chunk, consume_rest):
+    tracemalloc.start()
+    started = time.perf_counter()
+    get_first_chunk()
+    first_byte = time.perf_counter() - started
+    consume_rest()
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_byte, total, peak
+
+
+class ShoppingCartExportBenchmark(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass'
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS)
+        ])
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=cls.user, name=f'Рецепт {i}', text='-',
+                image='images/temp.png'
+            )
+            for i in range(RECIPES)
+        ])
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(
+                recipe_id=recipe,
+                ingredient_id=ingredients[
+                    (number * INGREDIENTS_PER_RECIPE + shift) % INGREDIENTS
+                ],
+                amount=shift + 1,
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(INGREDIENTS_PER_RECIPE)
+        ], batch_size=5000)
+        ShoppingList.objects.bulk_create([
+            ShoppingList(user=cls.user, recipe_id=recipe)
+            for recipe in recipes
+        ])
+        # bulk_create не отправляет сигналы, суммы собираются заново.
+        rebuild_carts()
+
+    def test_compare_export(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        results = {}
+
+        state = {}
+        results['legacy'] = measure(
+            lambda: state.update(response=legacy_download(self.user)),
+            lambda: state['response'].content,
+        )
+
+        stream = {}
+
+        def first_chunk():
+            response = client.get('/api/recipes/download_shopping_cart/')
+            stream['content'] = iter(response.streaming_content)
+            stream['chunks'] = [next(stream['content'])]
+
+        results['streaming'] = measure(
+            first_chunk, lambda: stream['chunks'].extend(stream['content'])
+        )
+        # Обе выгрузки содержат одни и те же строки без учета номеров.
+        self.assertEqual(
+            export_lines(state['response'].content),
+            export_lines(b''.join(stream['chunks']))
+        )
+
+        print(f'\nКорзина: {RECIPES} рецептов, {INGREDIENTS} ингредиентов')
+        for name, (first_byte, total, peak) in results.items():
+            print(
+                f'{name:>10}: первый байт {first_byte * 1000:.1f} мс, '
+                f'всего {total * 1000:.1f} мс, '
+                f'пик памяти {peak / 1024:.0f} КиБ'
+            )
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, modify_settings, override_settings
+from rest_framework.test import APIClient
+
+from foodgram.profiling import fingerprint
+from recipes.models import Tag
+
+MIDDLEWARE = 'foodgram.profiling.ProfilingMiddleware'
+
+
+@modify_settings(MIDDLEWARE={'prepend': MIDDLEWARE})
+@override_settings(PROFILING_SAMPLE_RATE=1, RESPONSE_CACHE=False)
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#000001')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url):
+        with self.assertLogs('foodgram.profiling', 'INFO') as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_report(self):
+        """Заголовок Server-Timing и строка журнала с числом запросов."""
+        response, record = self.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertEqual(record['view'], 'tags-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreaterEqual(record['queries'], 1)
+        for metric in ('total_ms', 'db_ms', 'view_ms', 'app_ms', 'render_ms'):
+            self.assertIn(metric, record)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get('/api/tags/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_slow_request_saves_cprofile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(
+            PROFILING_CPROFILE_DIR=directory, PROFILING_SLOW_MS=0
+        ):
+            response, record = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(record['cprofile'])
+        ])
+
+
+class FingerprintTests(TestCase):
+    def test_literals_and_in_lists(self):
+        """Запросы, отличающиеся только значениями, совпадают."""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id = 1 AND name = \'a\''),
+            fingerprint('SELECT * FROM t WHERE id = 25 AND name = \'b\''),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            'SELECT * FROM t WHERE id IN (...)'
+        )
@@ -0,0 +1,1459 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    AsyncRequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes import async_views, batch
+from recipes.autocomplete import ingredient_index
+from recipes.flags import get_flags_cache, get_user_flags
+from recipes.images import make_variants, variant_name
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCartItem,
+    ShoppingList,
+    Tag
+)
+from users.models import Follow, User
+
+RECIPES_URL = '/api/recipes/'
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password-123',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def create_recipes(author, count, tags, ingredients):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            image='images/temp.png',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=2)
+            for ingredient in ingredients
+        ])
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}', color=f'#0000{i}0')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_page(self, count):
+        authors = [create_user(f'author{count}_{i}') for i in range(count)]
+        recipes = []
+        for author in authors:
+            recipes += create_recipes(author, 1, self.tags, self.ingredients)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingList.objects.create(user=self.user, recipe=recipes[0])
+        Follow.objects.create(user=self.user, author=authors[0])
+        return recipes
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        """Количество запросов списка рецептов не зависит от их числа."""
+        self.create_page(1)
+        # Пятый запрос читает отметки пользователя в пустой кэш.
+        with self.assertNumQueries(5):
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        # Новое избранное сбросило отметки, они читаются заново.
+        self.create_page(5)
+        with self.assertNumQueries(5):
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(len(response.data['results']), 6)
+        with self.assertNumQueries(4):
+            self.client.get(RECIPES_URL)
+
+    def test_list_reads_user_flags(self):
+        """Отметки избранного, покупок и подписки берутся из кэша."""
+        recipe = self.create_page(2)[0]
+        response = self.client.get(f'{RECIPES_URL}{recipe.id}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertEqual(len(response.data['ingredients']), 3)
+        self.assertEqual(len(response.data['tags']), 2)
+
+    def test_anonymous_list_flags_are_false(self):
+        """Для анонимного пользователя все отметки ложны."""
+        self.create_page(1)
+        response = APIClient().get(RECIPES_URL)
+        recipe = response.data['results'][0]
+        self.assertFalse(recipe['is_favorited'])
+        self.assertFalse(recipe['is_in_shopping_cart'])
+        self.assertFalse(recipe['author']['is_subscribed'])
+
+
+class UserFlagsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('flagger')
+        cls.author = create_user('flagged')
+        cls.recipe, = create_recipes(cls.author, 1, [], [])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'{RECIPES_URL}{self.recipe.id}/'
+
+    def test_toggles_refresh_cached_flags(self):
+        """Добавление и удаление сразу видны в отметках пользователя."""
+        self.client.get(self.url)
+        for path in ('favorite', 'shopping_cart'):
+            self.client.post(f'{self.url}{path}/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        with self.assertNumQueries(3):
+            recipe = self.client.get(self.url).data
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+
+        self.client.delete(f'{self.url}favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        recipe = self.client.get(self.url).data
+        self.assertFalse(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertFalse(recipe['author']['is_subscribed'])
+
+    def test_new_user_starts_empty(self):
+        """Кэш не переходит к пользователю с тем же id."""
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.client.get(self.url)
+        user_id = self.user.id
+        self.user.delete()
+        user = User.objects.create(
+            id=user_id, username='newcomer', email='newcomer@example.com'
+        )
+        self.client.force_authenticate(user)
+        self.assertFalse(self.client.get(self.url).data['is_favorited'])
+
+
+class SubscriptionsQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('subscriber')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def follow_authors(self, count, recipes_per_author):
+        for number in range(count):
+            author = create_user(f'writer{count}_{number}')
+            create_recipes(author, recipes_per_author, [], [])
+            Follow.objects.create(user=self.user, author=author)
+
+    def test_subscriptions_query_count_is_constant(self):
+        """Лента подписок не делает запросов на каждого автора."""
+        url = '/api/users/subscriptions/?recipes_limit=2'
+        self.follow_authors(1, 1)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        self.follow_authors(4, 5)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        author = response.data['results'][-1]
+        self.assertTrue(author['is_subscribed'])
+        self.assertEqual(author['recipes_count'], 5)
+        self.assertEqual(len(author['recipes']), 2)
+        self.assertEqual(
+            [recipe['name'] for recipe in author['recipes']],
+            ['Рецепт 4', 'Рецепт 3']
+        )
+
+    def test_invalid_recipes_limit(self):
+        for limit in ('abc', '-1'):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?recipes_limit={limit}'
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.BAD_REQUEST
+                )
+                self.assertIn('recipes_limit', response.data)
+
+
+# Проверяется сборка ответа, а не кэш ответов.
+@override_settings(RESPONSE_CACHE=False)
+class FeedPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('scroller')
+        cls.recipes = create_recipes(cls.user, 7, [], [])
+        # Одинаковое время публикации: порядок решает id.
+        Recipe.objects.update(pub_date=cls.recipes[0].pub_date)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_cursor_pages_cover_feed_once(self):
+        """Курсор проходит ленту без пропусков и повторов."""
+        expected = sorted(recipe.id for recipe in self.recipes)[::-1]
+        self.assertEqual(self.walk(f'{RECIPES_URL}?cursor=&limit=3'), expected)
+        self.assertEqual(self.walk(f'{RECIPES_URL}?page=1&limit=3'), expected)
+
+    def test_previous_link(self):
+        """Ссылка previous возвращает на предыдущую страницу."""
+        first = self.client.get(f'{RECIPES_URL}?cursor=&limit=3').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_count_is_optional(self):
+        """Без ?count=1 курсорная страница не выполняет COUNT(*)."""
+        with self.assertNumQueries(3):
+            response = self.client.get(f'{RECIPES_URL}?cursor=')
+        self.assertNotIn('count', response.data)
+        response = self.client.get(f'{RECIPES_URL}?cursor=&count=1')
+        self.assertEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'{RECIPES_URL}?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_forged_cursor(self):
+        """Значения не того типа в курсоре дают 404, а не 500."""
+        for position in (['abc', 1], [{'a': 1}, 1], [None, None]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position}).encode()
+            ).decode()
+            with self.subTest(position=position):
+                response = self.client.get(f'{RECIPES_URL}?cursor={cursor}')
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_FOUND
+                )
+
+    def test_subscriptions_cursor(self):
+        """Подписки листаются курсором по id автора."""
+        authors = [create_user(f'followed{i}') for i in range(3)]
+        for author in authors:
+            Follow.objects.create(user=self.user, author=author)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(
+            self.walk('/api/users/subscriptions/?cursor=&limit=2'),
+            [author.id for author in authors]
+        )
+
+
+# Проверяется сборка ответа, а не кэш ответов.
+@override_settings(RESPONSE_CACHE=False)
+class RecipeFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('filterer')
+        cls.other = create_user('stranger')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}', color=f'#0000{i}0')
+            for i in range(3)
+        ]
+        cls.own = create_recipes(cls.user, 2, cls.tags[:2], [])
+        cls.foreign = create_recipes(cls.other, 2, cls.tags[1:], [])
+        Favorite.objects.create(user=cls.user, recipe=cls.foreign[0])
+        ShoppingList.objects.create(user=cls.user, recipe=cls.own[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, query, client=None):
+        response = (client or self.client).get(f'{RECIPES_URL}?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return sorted(recipe['id'] for recipe in response.data['results'])
+
+    def test_several_tags_without_duplicates(self):
+        """Рецепт с несколькими подходящими тегами выводится один раз."""
+        with CaptureQueriesContext(connection) as queries:
+            ids = self.ids('tags=tag0&tags=tag1&tags=tag2')
+        self.assertEqual(
+            ids, sorted(recipe.id for recipe in self.own + self.foreign)
+        )
+        self.assertFalse(any(
+            'DISTINCT' in query['sql'] for query in queries.captured_queries
+        ))
+        self.assertEqual(
+            self.ids('tags=tag0'), sorted(recipe.id for recipe in self.own)
+        )
+
+    def test_zero_keeps_other_filters(self):
+        """is_favorited=0 не отменяет остальные фильтры."""
+        self.assertEqual(
+            self.ids(f'author={self.other.id}&is_favorited=0'),
+            sorted(recipe.id for recipe in self.foreign)
+        )
+
+    def test_flags_compose_with_tags(self):
+        self.assertEqual(
+            self.ids('is_favorited=1&tags=tag2'), [self.foreign[0].id]
+        )
+        self.assertEqual(self.ids('is_in_shopping_cart=1&tags=tag2'), [])
+        self.assertEqual(
+            self.ids('is_in_shopping_cart=1&tags=tag0'), [self.own[0].id]
+        )
+
+    def test_anonymous_flags_return_nothing(self):
+        self.assertEqual(self.ids('is_favorited=1', APIClient()), [])
+
+
+# Проверяется сборка ответа, а не кэш ответов.
+@override_settings(RESPONSE_CACHE=False)
+class RecipeSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('cook')
+        cls.soup, cls.salad, cls.pie = create_recipes(author, 3, [], [])
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        Recipe.objects.filter(id=cls.soup.id).update(name='борщ')
+        Recipe.objects.filter(id=cls.salad.id).update(
+            name='винегрет', text='свекла для борща'
+        )
+        cls.soup.tags.set([cls.tag])
+
+    def ids(self, query):
+        response = APIClient().get(f'{RECIPES_URL}?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return sorted(recipe['id'] for recipe in response.data['results'])
+
+    def test_search_name_and_text(self):
+        """Поиск находит слово в названии и в описании."""
+        self.assertEqual(
+            self.ids('search=борщ'), sorted([self.soup.id, self.salad.id])
+        )
+        self.assertEqual(self.ids('search=свекла'), [self.salad.id])
+
+    def test_search_combines_with_tags(self):
+        self.assertEqual(self.ids('search=борщ&tags=lunch'), [self.soup.id])
+
+    def test_empty_search_returns_feed(self):
+        self.assertEqual(len(self.ids('search=')), 3)
+
+
+class RecipesByIngredientsTests(TestCase):
+    url = f'{RECIPES_URL}by_ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('pantry')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}', measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.full, = create_recipes(author, 1, [], cls.ingredients[:2])
+        cls.half, = create_recipes(author, 1, [], cls.ingredients[1:3])
+        cls.far, = create_recipes(author, 1, [], cls.ingredients[1:])
+        create_recipes(author, 1, [], cls.ingredients[3:])
+
+    def search(self, query):
+        response = APIClient().get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            (recipe['id'], round(recipe['coverage'], 2), recipe['missing'])
+            for recipe in response.data['results']
+        ]
+
+    def test_ranked_by_coverage(self):
+        """Рецепты сортируются по доле имеющихся ингредиентов."""
+        first, second = self.ingredients[:2]
+        with self.assertNumQueries(4):
+            found = self.search(
+                f'ingredients={first.id}&ingredients={second.id}'
+            )
+        self.assertEqual(found, [
+            (self.full.id, 1.0, 0),
+            (self.half.id, 0.5, 1),
+            (self.far.id, 0.33, 2),
+        ])
+
+    def test_cursor_keeps_coverage_order(self):
+        """?cursor= не заменяет сортировку по покрытию лентой."""
+        first, second = self.ingredients[:2]
+        found = self.search(
+            f'ingredients={first.id}&ingredients={second.id}&cursor='
+        )
+        self.assertEqual(
+            [recipe for recipe, *_ in found],
+            [self.full.id, self.half.id, self.far.id]
+        )
+
+    def test_max_missing(self):
+        first, second = self.ingredients[:2]
+        found = self.search(
+            f'ingredients={first.id}&ingredients={second.id}&max_missing=1'
+        )
+        self.assertEqual(
+            [recipe for recipe, *_ in found], [self.full.id, self.half.id]
+        )
+
+    def test_ingredients_required(self):
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('async')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'соль морская', 'фасоль')
+        ]
+        cls.recipe, = create_recipes(
+            cls.user, 1, [cls.tag], cls.ingredients
+        )
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        self.factory = AsyncRequestFactory()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def call(self, view, path, method='get', headers=None, **kwargs):
+        if headers is None:
+            headers = {'authorization': f'Token {self.token.key}'}
+        request = getattr(self.factory, method)(path, **headers)
+        return async_to_sync(view)(request, **kwargs)
+
+    def assert_same(self, view, path, **kwargs):
+        response = self.call(view, path, **kwargs)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            json.loads(response.content), self.client.get(path).json()
+        )
+
+    def test_responses_match_sync_views(self):
+        """Асинхронные версии отдают тот же JSON, что и ViewSet."""
+        self.assert_same(async_views.tag_list, '/api/tags/')
+        self.assert_same(
+            async_views.ingredient_list, '/api/ingredients/?name=соль'
+        )
+        self.assert_same(
+            async_views.recipe_detail, f'{RECIPES_URL}{self.recipe.id}/',
+            pk=self.recipe.id
+        )
+
+    def test_conditional_get(self):
+        """ETag тот же, что у ViewSet, с If-None-Match ответ 304."""
+        for view, path in (
+            (async_views.tag_list, '/api/tags/'),
+            (async_views.ingredient_list, '/api/ingredients/?name=%D1%81'),
+        ):
+            etag = self.client.get(path)['ETag']
+            self.assertEqual(self.call(view, path)['ETag'], etag)
+            response = self.call(view, path, headers={
+                'authorization': f'Token {self.token.key}',
+                'if-none-match': etag,
+            })
+            self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_anonymous_recipe_uses_response_cache(self):
+        """Анонимная карточка получает 304 и кэш ответов ViewSet."""
+        cache.clear()
+        path = f'{RECIPES_URL}{self.recipe.id}/'
+        first = self.call(
+            async_views.recipe_detail, path, headers={}, pk=self.recipe.id
+        )
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            cached = self.call(
+                async_views.recipe_detail, path, headers={},
+                pk=self.recipe.id
+            )
+            not_modified = self.call(
+                async_views.recipe_detail, path,
+                headers={'if-none-match': first['ETag']}, pk=self.recipe.id
+            )
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_recipe_not_found(self):
+        response = self.call(
+            async_views.recipe_detail, f'{RECIPES_URL}0/', pk=0
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_writes_go_to_viewset(self):
+        response = self.call(
+            async_views.recipe_detail, f'{RECIPES_URL}{self.recipe.id}/',
+            method='delete', pk=self.recipe.id
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertFalse(Recipe.objects.exists())
+        response = self.call(async_views.tag_list, '/api/tags/', 'post')
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED
+        )
+
+
+class DownloadShoppingCartTests(TestCase):
+    url = f'{RECIPES_URL}download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.ingredients = [
+            Ingredient.objects.create(name='Соль', measurement_unit='г'),
+            Ingredient.objects.create(name='Мука', measurement_unit='кг'),
+        ]
+        for recipe in create_recipes(cls.user, 3, [], cls.ingredients):
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, export_format=None):
+        url = self.url
+        if export_format:
+            url += f'?format={export_format}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_txt_is_default(self):
+        """По умолчанию список покупок выгружается нумерованным текстом."""
+        response, content = self.download()
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="shopping_list.txt"'
+        )
+        self.assertEqual(content, '1) Мука 6 кг\n2) Соль 6 г\n')
+
+    def test_csv_and_json_formats(self):
+        """Выгрузка в CSV и JSON."""
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            content.splitlines(),
+            ['name,amount,measurement_unit', 'Мука,6,кг', 'Соль,6,г']
+        )
+        response, content = self.download('json')
+        self.assertEqual(
+            json.loads(content),
+            [
+                {'name': 'Мука', 'amount': 6, 'measurement_unit': 'кг'},
+                {'name': 'Соль', 'amount': 6, 'measurement_unit': 'г'},
+            ]
+        )
+
+    def test_unknown_format(self):
+        """Неизвестный формат выгрузки не поддерживается."""
+        response = self.client.get(f'{self.url}?format=xls')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ShoppingCartItemsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('chef')
+        cls.buyers = [create_user('buyer1'), create_user('buyer2')]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Сахар', 'Соль')
+        ]
+        cls.recipes = create_recipes(cls.author, 2, [], cls.ingredients[:2])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyers[0])
+
+    def items(self, user):
+        return dict(ShoppingCartItem.objects.filter(user=user).values_list(
+            'ingredient__name', 'amount'
+        ))
+
+    def test_items_follow_cart_changes(self):
+        """Суммы меняются при добавлении и удалении рецептов."""
+        for recipe in self.recipes:
+            self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+        self.assertEqual(
+            self.items(self.buyers[0]), {'Мука': 4, 'Сахар': 4}
+        )
+        self.client.delete(f'{RECIPES_URL}{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(
+            self.items(self.buyers[0]), {'Мука': 2, 'Сахар': 2}
+        )
+        self.client.delete(f'{RECIPES_URL}{self.recipes[1].id}/shopping_cart/')
+        self.assertEqual(self.items(self.buyers[0]), {})
+
+    def test_recipe_edit_updates_every_cart(self):
+        """Правка ингредиентов рецепта переносится во все списки."""
+        flour, sugar, salt = self.ingredients
+        recipe = self.recipes[0]
+        for buyer in self.buyers:
+            ShoppingList.objects.create(user=buyer, recipe=recipe)
+        ShoppingList.objects.create(
+            user=self.buyers[0], recipe=self.recipes[1]
+        )
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.patch(f'{RECIPES_URL}{recipe.id}/', {
+            'ingredients': [
+                {'id': flour.id, 'amount': 5}, {'id': salt.id, 'amount': 1}
+            ],
+            'tags': [],
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            self.items(self.buyers[0]), {'Мука': 7, 'Сахар': 2, 'Соль': 1}
+        )
+        self.assertEqual(self.items(self.buyers[1]), {'Мука': 5, 'Соль': 1})
+
+    def test_recipe_deletion_leaves_carts(self):
+        ShoppingList.objects.create(
+            user=self.buyers[0], recipe=self.recipes[0]
+        )
+        self.recipes[0].delete()
+        self.assertEqual(self.items(self.buyers[0]), {})
+
+    def test_summary(self):
+        for recipe in self.recipes:
+            ShoppingList.objects.create(user=self.buyers[0], recipe=recipe)
+        response = self.client.get(f'{RECIPES_URL}shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        flour, sugar = self.ingredients[:2]
+        self.assertEqual(response.json(), {
+            'recipes_count': 2,
+            'ingredients': [
+                {'id': flour.id, 'name': 'Мука', 'measurement_unit': 'г',
+                 'amount': 4},
+                {'id': sugar.id, 'name': 'Сахар', 'measurement_unit': 'г',
+                 'amount': 4},
+            ],
+        })
+
+    def test_recount_rebuilds_items(self):
+        """Команда recount пересобирает разошедшиеся суммы."""
+        ShoppingList.objects.create(
+            user=self.buyers[0], recipe=self.recipes[0]
+        )
+        ShoppingCartItem.objects.update(amount=100)
+        ShoppingCartItem.objects.create(
+            user=self.buyers[1], ingredient=self.ingredients[2], amount=3
+        )
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(
+            self.items(self.buyers[0]), {'Мука': 2, 'Сахар': 2}
+        )
+        self.assertEqual(self.items(self.buyers[1]), {})
+
+
+class IngredientAutocompleteTests(TestCase):
+    url = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('соль', 'соль морская', 'сода', 'морская капуста'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def names(self, query):
+        response = self.client.get(self.url, {'name': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_ranking_without_database(self):
+        """Точные совпадения, затем по началу, затем по вхождению."""
+        self.names('')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.names('Соль'), ['соль', 'соль морская']
+            )
+            self.assertEqual(
+                self.names('мор'), ['морская капуста', 'соль морская']
+            )
+
+    def test_index_refreshes_on_change(self):
+        """Новый ингредиент сразу появляется в подсказках."""
+        self.names('')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        self.assertEqual(self.names('сах'), ['сахар'])
+
+    def test_fuzzy_mode(self):
+        """Нечеткий поиск на SQLite сводится к поиску по вхождению."""
+        response = self.client.get(self.url, {'name': 'морск', 'fuzzy': 1})
+        self.assertEqual(
+            sorted(ingredient['name'] for ingredient in response.data),
+            ['морская капуста', 'соль морская']
+        )
+
+    def test_name_and_unit_are_unique(self):
+        """Ингредиент с тем же названием и единицей не создается."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='соль', measurement_unit='щепотка')
+
+    def test_prefix_matches_search_filter(self):
+        """Совпадения по началу названия совпадают с SearchFilter."""
+        for query in ('с', 'со', 'сол', 'мор', 'х'):
+            with self.settings(INGREDIENT_AUTOCOMPLETE=False):
+                expected = self.names(query)
+            found = [
+                name for name in self.names(query)
+                if name.startswith(query)
+            ]
+            self.assertEqual(sorted(found), sorted(expected))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('chef')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.recipe = create_recipes(cls.author, 1, [cls.tag], [])[0]
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        return etag
+
+    def test_not_modified_without_queries(self):
+        """Повторный запрос с If-None-Match получает 304 без запросов."""
+        for url in (
+            '/api/tags/',
+            '/api/ingredients/',
+            RECIPES_URL,
+            f'{RECIPES_URL}{self.recipe.id}/',
+        ):
+            with self.subTest(url=url):
+                self.revalidate(url)
+
+    def test_change_invalidates_etag(self):
+        """Изменение тега меняет ETag тегов и рецептов."""
+        tags_etag = self.revalidate('/api/tags/')
+        recipes_etag = self.revalidate(RECIPES_URL)
+        self.tag.name = 'Обед'
+        self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=tags_etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(
+            RECIPES_URL, HTTP_IF_NONE_MATCH=recipes_etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_authenticated_recipes_have_no_etag(self):
+        """Рецепты для пользователя не кэшируются по ETag."""
+        client = APIClient()
+        client.force_authenticate(self.author)
+        self.assertNotIn('ETag', client.get(RECIPES_URL))
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('host')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', slug=f'c{i}', color=f'#10000{i}'
+            )
+            for i in range(2)
+        ]
+        cls.recipes = create_recipes(cls.author, 2, cls.tags, [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, outcome):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['X-Cache'], outcome)
+        return response.json()
+
+    def test_hit_without_queries(self):
+        """Повторный запрос с теми же параметрами отдается из кэша."""
+        first = self.get(f'{RECIPES_URL}?tags=c0&tags=c1&limit=1', 'MISS')
+        with self.assertNumQueries(0):
+            second = self.get(f'{RECIPES_URL}?limit=1&tags=c1&tags=c0', 'HIT')
+        self.assertEqual(first, second)
+
+    def test_authenticated_are_not_cached(self):
+        self.client.force_authenticate(self.author)
+        self.assertNotIn('X-Cache', self.client.get(RECIPES_URL))
+
+    def test_change_invalidates_only_affected_card(self):
+        """Правка рецепта сбрасывает его карточку, но не соседние."""
+        changed, other = (f'{RECIPES_URL}{r.id}/' for r in self.recipes)
+        self.get(changed, 'MISS')
+        self.get(other, 'MISS')
+        self.get(RECIPES_URL, 'MISS')
+        self.recipes[0].name = 'Новое название'
+        self.recipes[0].save()
+        self.assertEqual(self.get(changed, 'MISS')['name'], 'Новое название')
+        self.get(other, 'HIT')
+        self.get(RECIPES_URL, 'MISS')
+
+    def test_author_and_tag_changes(self):
+        url = f'{RECIPES_URL}{self.recipes[0].id}/'
+        self.get(url, 'MISS')
+        self.get(RECIPES_URL, 'MISS')
+        self.author.first_name = 'Шеф'
+        self.author.save()
+        self.assertEqual(self.get(url, 'MISS')['author']['first_name'], 'Шеф')
+        self.get(RECIPES_URL, 'MISS')
+        self.tags[0].name = 'Ужин'
+        self.tags[0].save()
+        self.get(url, 'MISS')
+
+    def test_other_users_keep_cache(self):
+        """Регистрация и правка пользователя без рецептов не сбрасывают
+        список."""
+        self.get(RECIPES_URL, 'MISS')
+        response = self.client.post('/api/users/', {
+            'email': 'newcomer@example.com',
+            'username': 'newcomer',
+            'first_name': 'Новый',
+            'last_name': 'Пользователь',
+            'password': 'newcomer-password-1',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        user = User.objects.get(username='newcomer')
+        user.first_name = 'Другой'
+        user.save()
+        self.get(RECIPES_URL, 'HIT')
+
+    def test_stale_while_revalidate(self):
+        """Пока ответ пересобирает другой запрос, отдается устаревший."""
+        url = f'{RECIPES_URL}{self.recipes[0].id}/'
+        self.get(url, 'MISS')
+        self.recipes[0].name = 'Новое название'
+        self.recipes[0].save()
+        add = cache.add
+
+        def lock_taken(key, *args, **kwargs):
+            if key.startswith('response-lock:'):
+                return False
+            return add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=lock_taken):
+            self.assertEqual(self.get(url, 'STALE')['name'], 'Рецепт 0')
+        self.get(url, 'MISS')
+
+    def test_stats(self):
+        self.get(RECIPES_URL, 'MISS')
+        self.get(RECIPES_URL, 'HIT')
+        stats_url = f'{RECIPES_URL}cache_stats/'
+        self.client.force_authenticate(self.author)
+        response = self.client.get(stats_url)
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin-123'
+        )
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get(stats_url).json(), {
+            'hit': 1, 'stale': 0, 'miss': 1, 'hit_rate': 0.5
+        })
+
+
+class BatchEndpointsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('planner')
+        cls.authors = [create_user('cook1'), create_user('cook2')]
+        cls.ingredient = Ingredient.objects.create(
+            name='Рис', measurement_unit='г'
+        )
+        cls.recipes = create_recipes(
+            cls.authors[0], 5, [], [cls.ingredient]
+        )
+        cls.ids = [recipe.id for recipe in cls.recipes]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, url, ids, method='post'):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return {
+            item['id']: item['status'] for item in response.json()['results']
+        }
+
+    def test_favorites(self):
+        """Статус по каждому id, счетчики и отметки обновлены."""
+        url = f'{RECIPES_URL}favorite/batch/'
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        missing = max(self.ids) + 1
+        statuses = self.batch(url, self.ids[:3] + [missing, self.ids[1]])
+        self.assertEqual(statuses, {
+            self.ids[0]: 'exists',
+            self.ids[1]: 'added',
+            self.ids[2]: 'added',
+            missing: 'not_found',
+        })
+        self.assertEqual(
+            set(Recipe.objects.filter(favorites_count=1).values_list(
+                'id', flat=True
+            )),
+            set(self.ids[:3])
+        )
+        favorited = {
+            recipe['id'] for recipe in self.client.get(
+                f'{RECIPES_URL}?limit=10'
+            ).json()['results'] if recipe['is_favorited']
+        }
+        self.assertEqual(favorited, set(self.ids[:3]))
+
+        statuses = self.batch(url, self.ids[2:4], 'delete')
+        self.assertEqual(
+            statuses, {self.ids[2]: 'removed', self.ids[3]: 'absent'}
+        )
+        self.assertEqual(
+            set(Favorite.objects.values_list('recipe_id', flat=True)),
+            set(self.ids[:2])
+        )
+
+    def test_concurrent_insert_is_not_counted(self):
+        """Строку, вставленную другим запросом, не считает и этот."""
+        recipe = self.recipes[0]
+        insert_new = batch.insert_new
+
+        def concurrent_add(*args):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            return insert_new(*args)
+
+        with mock.patch('recipes.batch.insert_new', concurrent_add):
+            statuses = self.batch(f'{RECIPES_URL}favorite/batch/', [recipe.id])
+        self.assertEqual(statuses, {recipe.id: 'exists'})
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_query_count_does_not_depend_on_ids(self):
+        url = f'{RECIPES_URL}shopping_cart/batch/'
+        with CaptureQueriesContext(connection) as few:
+            self.batch(url, self.ids[:2])
+        with CaptureQueriesContext(connection) as many:
+            self.batch(url, self.ids[2:])
+        self.assertEqual(len(few), len(many))
+
+    def test_cart(self):
+        url = f'{RECIPES_URL}shopping_cart/batch/'
+        self.batch(url, self.ids)
+        self.assertEqual(
+            ShoppingCartItem.objects.get(user=self.user).amount, 10
+        )
+        self.batch(url, self.ids[:4], 'delete')
+        self.assertEqual(
+            ShoppingCartItem.objects.get(user=self.user).amount, 2
+        )
+        self.assertEqual(
+            Recipe.objects.filter(in_carts_count=1).get().id, self.ids[4]
+        )
+
+    def test_subscribe(self):
+        url = '/api/users/subscribe/batch/'
+        first, second = self.authors
+        statuses = self.batch(url, [first.id, second.id, self.user.id])
+        self.assertEqual(statuses, {
+            first.id: 'added', second.id: 'added', self.user.id: 'invalid'
+        })
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 2)
+        self.batch(url, [first.id], 'delete')
+        self.user.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+        self.assertEqual(first.followers_count, 0)
+
+    def test_validation(self):
+        url = f'{RECIPES_URL}favorite/batch/'
+        for data in ({}, {'ids': []}, {'ids': ['x']}, {'ids': [1] * 101}):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentToggleTests(TransactionTestCase):
+    """Одновременные добавления одного рецепта, как при двойном клике.
+
+    Нужна база с параллельной записью из нескольких соединений
+    (PostgreSQL), тестовая SQLite в памяти блокирует таблицу.
+    """
+
+    threads = 8
+
+    def setUp(self):
+        get_flags_cache().clear()
+        self.user = create_user('clicker')
+        self.recipe, = create_recipes(
+            create_user('author'), 1, [],
+            [Ingredient.objects.create(name='Соль', measurement_unit='г')]
+        )
+
+    def post(self, url, method='post'):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            return getattr(client, method)(url).status_code
+        finally:
+            # У каждого потока свое соединение с базой.
+            connection.close()
+
+    def delete(self, url):
+        return self.post(url, 'delete')
+
+    def test_only_one_insert_wins(self):
+        for path in ('favorite', 'shopping_cart'):
+            url = f'{RECIPES_URL}{self.recipe.id}/{path}/'
+            with ThreadPoolExecutor(self.threads) as executor:
+                codes = sorted(executor.map(self.post, [url] * self.threads))
+            self.assertEqual(
+                codes,
+                [HTTPStatus.CREATED]
+                + [HTTPStatus.BAD_REQUEST] * (self.threads - 1)
+            )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(
+            ShoppingCartItem.objects.get(user=self.user).amount, 2
+        )
+        flags = get_user_flags(self.user)
+        self.assertEqual(flags['favorites'], {self.recipe.id})
+        self.assertEqual(flags['cart'], {self.recipe.id})
+
+    def test_only_one_delete_counts(self):
+        ingredient = Ingredient.objects.create(
+            name='Перец', measurement_unit='г'
+        )
+        other = create_recipes(self.user, 1, [], [ingredient])[0]
+        IngredientAmount.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=3
+        )
+        for recipe in (self.recipe, other):
+            self.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+        url = f'{RECIPES_URL}{self.recipe.id}/shopping_cart/'
+        with ThreadPoolExecutor(self.threads) as executor:
+            codes = set(executor.map(self.delete, [url] * self.threads))
+        self.assertEqual(codes, {HTTPStatus.NO_CONTENT})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertEqual(
+            ShoppingCartItem.objects.get(
+                user=self.user, ingredient=ingredient
+            ).amount, 2
+        )
+
+    def test_only_one_favorite_delete_counts(self):
+        author = self.recipe.author
+        other = create_user('other')
+        for user in (self.user, other):
+            Favorite.objects.create(user=user, recipe=self.recipe)
+            Follow.objects.create(user=user, author=author)
+        for url, absent in (
+            (f'{RECIPES_URL}{self.recipe.id}/favorite/', HTTPStatus.NOT_FOUND),
+            (f'/api/users/{author.id}/subscribe/', HTTPStatus.NO_CONTENT),
+        ):
+            with ThreadPoolExecutor(self.threads) as executor:
+                codes = sorted(executor.map(self.delete, [url] * self.threads))
+            self.assertEqual(
+                codes,
+                sorted([HTTPStatus.NO_CONTENT]
+                       + [absent] * (self.threads - 1))
+            )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 0)
+
+
+class ToggleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('toggler')
+        cls.recipe, = create_recipes(create_user('maker'), 1, [], [])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'{RECIPES_URL}{self.recipe.id}/favorite/'
+
+    def test_insert_without_existence_check(self):
+        """Повтор отсекает уникальный индекс, а не SELECT перед INSERT."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and Favorite._meta.db_table in query['sql']
+        ])
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.json(), {'errors': 'Уже добавлен!'})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_row_added_concurrently(self):
+        """Строка, вставленная другим запросом, дает 400, а не 500."""
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe=self.recipe)]
+        )
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('fan')
+        cls.author = create_user('cook')
+        cls.recipe = create_recipes(cls.author, 1, [], [])[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_counters(self, favorites, carts, followers):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, favorites)
+        self.assertEqual(self.recipe.in_carts_count, carts)
+        self.assertEqual(self.author.followers_count, followers)
+        self.assertEqual(self.user.following_count, followers)
+        self.assertEqual(self.author.recipes_count, 1)
+
+    def test_counters_follow_api_calls(self):
+        """Счетчики меняются вместе с избранным, покупками и подписками."""
+        recipe_url = f'{RECIPES_URL}{self.recipe.id}/'
+        subscribe_url = f'/api/users/{self.author.id}/subscribe/'
+        self.client.post(f'{recipe_url}favorite/')
+        self.client.post(f'{recipe_url}shopping_cart/')
+        self.client.post(subscribe_url)
+        self.assert_counters(1, 1, 1)
+        self.client.delete(f'{recipe_url}favorite/')
+        self.client.delete(f'{recipe_url}shopping_cart/')
+        self.client.delete(subscribe_url)
+        self.assert_counters(0, 0, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет разошедшиеся счетчики."""
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Follow.objects.create(user=self.user, author=self.author)
+        Recipe.objects.update(favorites_count=7, in_carts_count=3)
+        User.objects.update(
+            recipes_count=0, followers_count=5, following_count=5
+        )
+        call_command('recount', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.author.following_count, 0)
+
+
+class ImportIngredientsTests(TestCase):
+    data_dir = Path(__file__).resolve().parent.parent / 'data'
+
+    def import_file(self, name):
+        call_command(
+            'import_ingredients', str(self.data_dir / name),
+            batch_size=500, stdout=StringIO()
+        )
+        return Ingredient.objects.count()
+
+    def test_import_is_idempotent(self):
+        """Повторная загрузка и загрузка JSON не создают дубликатов."""
+        Ingredient.objects.create(name='абрикосы', measurement_unit='г')
+        with open(self.data_dir / 'ingredients.csv', encoding='utf-8') as file:
+            expected = len(set(file.read().splitlines()))
+        self.assertEqual(self.import_file('ingredients.csv'), expected)
+        self.assertEqual(self.import_file('ingredients.csv'), expected)
+        self.assertEqual(self.import_file('ingredients.json'), expected)
+
+    def test_json_in_chunks_and_inserted_count(self):
+        """JSON читается частями, в отчете только вставленные строки."""
+        command = 'recipes.management.commands.import_ingredients'
+        output = StringIO()
+        with mock.patch(f'{command}.JSON_CHUNK', 100):
+            call_command(
+                'import_ingredients', str(self.data_dir / 'ingredients.json'),
+                stdout=output
+            )
+        count = Ingredient.objects.count()
+        self.assertGreater(count, 0)
+        self.assertIn(f'Добавлено ингредиентов: {count} ', output.getvalue())
+        # Строки, вставленные параллельно, пропускает ignore_conflicts.
+        output = StringIO()
+        with mock.patch(f'{command}.unique_rows', lambda rows, seen: rows):
+            call_command(
+                'import_ingredients', str(self.data_dir / 'ingredients.csv'),
+                stdout=output
+            )
+        self.assertEqual(Ingredient.objects.count(), count)
+        self.assertIn('Добавлено ингредиентов: 0 ', output.getvalue())
+
+
+class RecipeUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('editor')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f't{i}', color=f'#00000{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipe = create_recipes(
+            cls.author, 1, cls.tags[:1], cls.ingredients[:2]
+        )[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.url = f'{RECIPES_URL}{self.recipe.id}/'
+
+    def patch(self, ingredients, tags):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, {
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in ingredients
+                ],
+                'tags': [tag.id for tag in tags],
+                'name': 'Рецепт 0',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query['sql'].split()[0] for query in context.captured_queries
+            if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))
+        ]
+
+    def test_unchanged_payload_does_not_write(self):
+        """Неизмененный рецепт сохраняется без записи в базу."""
+        writes = self.patch(
+            [(self.ingredients[0], 2), (self.ingredients[1], 2)],
+            self.tags[:1]
+        )
+        self.assertEqual(writes, [])
+
+    def test_only_differences_are_written(self):
+        """Записываются только изменившиеся ингредиенты и теги."""
+        first, second, third = self.ingredients
+        rows_before = dict(
+            self.recipe.recipes_ingredients_list.values_list(
+                'ingredient_id', 'id'
+            )
+        )
+        writes = self.patch([(first, 2), (third, 5)], self.tags)
+        self.assertEqual(writes, ['DELETE', 'INSERT', 'INSERT'])
+        self.assertEqual(
+            dict(self.recipe.recipes_ingredients_list.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {first.id: 2, third.id: 5}
+        )
+        self.assertEqual(
+            self.recipe.recipes_ingredients_list.get(ingredient=first).id,
+            rows_before[first.id]
+        )
+        self.assertEqual(
+            set(self.recipe.tags.values_list('id', flat=True)),
+            {tag.id for tag in self.tags}
+        )
+
+
+def image_data(color='red', size=(600, 400)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class RecipeImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('photographer')
+        cls.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        cls.ingredient = Ingredient.objects.create(
+            name='Перец', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, image):
+        return self.client.post(RECIPES_URL, {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            'tags': [self.tag.id],
+            'image': image,
+            'name': 'Рецепт с фото',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }, format='json')
+
+    def test_same_image_is_stored_once(self):
+        """Повторная загрузка того же изображения не создает копию."""
+        image = image_data()
+        self.create_recipe(image)
+        self.create_recipe(image)
+        names = Recipe.objects.values_list('image', flat=True)
+        self.assertEqual(len(set(names)), 1)
+        self.assertRegex(names[0], r'^images/[0-9a-f]{64}\.png$')
+        self.assertEqual(
+            os.listdir(os.path.join(self.media_root, 'images')),
+            [os.path.basename(names[0])]
+        )
+
+    def test_same_image_is_not_saved_again(self):
+        """Повторно присланное изображение не перезаписывает рецепт."""
+        image = image_data()
+        recipe_id = self.create_recipe(image).data['id']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'{RECIPES_URL}{recipe_id}/', {'image': image}, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('UPDATE "recipes_recipe"')
+        ])
+
+    def test_oversize_image_is_rejected(self):
+        """Слишком большое изображение отклоняется до декодирования."""
+        with self.settings(IMAGE_MAX_UPLOAD_SIZE=100):
+            response = self.create_recipe(image_data())
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    def test_base64_with_line_breaks(self):
+        """Base64 с переводами строк через 76 символов (MIME) принимается."""
+        header, body = image_data().split(',')
+        lines = [body[i:i + 76] for i in range(0, len(body), 76)]
+        with mock.patch('recipes.fields.DECODE_CHUNK', 128):
+            response = self.create_recipe(f'{header},' + '\r\n'.join(lines))
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        with Recipe.objects.get().image.open() as image:
+            self.assertEqual(image.read(), base64.b64decode(body))
+
+    def test_base64_with_garbage_is_rejected(self):
+        """Посторонние символы, кроме пробельных, не пропускаются."""
+        header, body = image_data().split(',')
+        response = self.create_recipe(f'{header},{body[:8]}*{body[8:]}')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    def test_existing_variants_skip_decoding(self):
+        """Если копии уже есть, оригинал не открывается."""
+        self.create_recipe(image_data())
+        name = Recipe.objects.get().image.name
+        self.assertTrue(make_variants(name))
+        with mock.patch('recipes.images.Image.open') as open_image:
+            self.assertFalse(make_variants(name))
+        open_image.assert_not_called()
+
+    def test_variants_are_served_when_ready(self):
+        """После подготовки копий API отдает копию нужного размера."""
+        self.create_recipe(image_data())
+        recipe = Recipe.objects.get()
+        url = f'{RECIPES_URL}{recipe.id}/'
+        self.assertTrue(
+            self.client.get(url).data['image'].endswith(recipe.image.name)
+        )
+        make_variants(recipe.image.name)
+        self.assertTrue(
+            self.client.get(url).data['image'].endswith('_detail.webp')
+        )
+        self.assertTrue(
+            self.client.get(RECIPES_URL).data['results'][0][
+                'image'
+            ].endswith('_card.webp')
+        )
+        with Image.open(
+            os.path.join(self.media_root, variant_name(
+                recipe.image.name, 'list'
+            ))
+        ) as thumbnail:
+            self.assertEqual(thumbnail.size, (160, 107))
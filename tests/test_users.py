@@ -0,0 +1,97 @@
+from http import HTTPStatus
+
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.authentication import TokenCache, token_cache
+from users.models import Follow, User
+
+ME_URL = '/api/users/me/'
+PASSWORD = 'old-password-123'
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username='holder', email='holder@example.com', password=PASSWORD
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_request_skips_token_query(self):
+        """Повторный запрос с тем же токеном не читает Token и User."""
+        # Токен и отметки пользователя для is_subscribed.
+        with self.assertNumQueries(2):
+            self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+        self.assertEqual(response.data['username'], 'holder')
+
+    def test_logout_invalidates_token(self):
+        self.client.get(ME_URL)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = self.client.get(ME_URL)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_deactivation_invalidates_user(self):
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(ME_URL)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_password_change_refreshes_user(self):
+        """После смены пароля запрос видит новый хэш пароля."""
+        self.client.get(ME_URL)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': PASSWORD,
+            'new_password': 'new-password-456',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'new-password-456',
+            'new_password': 'third-password-789',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_password_change_keeps_counters(self):
+        """Смена пароля не затирает счетчики устаревшей копией."""
+        self.client.get(ME_URL)
+        follower = User.objects.create_user(
+            username='follower', email='follower@example.com',
+            password=PASSWORD
+        )
+        Follow.objects.create(user=follower, author=self.user)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': PASSWORD,
+            'new_password': 'new-password-456',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 1)
+        self.assertTrue(self.user.check_password('new-password-456'))
+
+    def test_cache_is_bounded(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'c')
+        expired = TokenCache(maxsize=2, ttl=-1)
+        expired.set('a', 'a')
+        self.assertIsNone(expired.get('a'))
+
+    def test_shared_cache_without_local_entries(self):
+        """Удаление в одном процессе сразу видно в другом."""
+        first, second = (
+            TokenCache(maxsize=2, ttl=0, shared='default', shared_ttl=60)
+            for _ in range(2)
+        )
+        first.set('key', 'value')
+        self.assertEqual(second.get('key'), 'value')
+        first.delete('key')
+        self.assertIsNone(second.get('key'))